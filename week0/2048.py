@@ -2,8 +2,8 @@
 Clone of 2048 game.
 """
 
-import poc_2048_gui  
 import random
+import time
 
 # Directions, DO NOT MODIFY
 UP = 1
@@ -51,6 +51,26 @@ def merge(line):
         new_line[index] = nonzero1
     return new_line
 
+def merge_with_score(line):
+    """
+    Same as 'merge', but returns a (new_line, score) tuple where score
+    is the sum of the tiles created by merging.
+    """
+    tiles = [item for item in line if item != 0]
+    new_line = []
+    score = 0
+    index = 0
+    while index < len(tiles):
+        if index + 1 < len(tiles) and tiles[index] == tiles[index + 1]:
+            new_line.append(tiles[index] * 2)
+            score += tiles[index] * 2
+            index += 2
+        else:
+            new_line.append(tiles[index])
+            index += 1
+    new_line.extend([0] * (len(line) - len(new_line)))
+    return new_line, score
+
 class TwentyFortyEight:
     """
     Class to run the game logic.
@@ -66,7 +86,32 @@ class TwentyFortyEight:
         """
         Reset the game so the grid is empty.
         """
-        return [[0 for dummy_col in range(self.grid_width)] for dummy_row in range(self.grid_height)]
+        self.value = [[0 for dummy_col in range(self.grid_width)] for dummy_row in range(self.grid_height)]
+        # Free cells are kept in a list with a position index, so both
+        # picking a random free cell and updating the set are O(1).
+        self._empty_cells = [(row, col) for row in range(self.grid_height)
+                             for col in range(self.grid_width)]
+        self._empty_index = {}
+        for pos in range(len(self._empty_cells)):
+            self._empty_index[self._empty_cells[pos]] = pos
+        return self.value
+
+    def _fill_cell(self, row, col):
+        """
+        Remove a cell from the free set by swapping in the last one.
+        """
+        pos = self._empty_index.pop((row, col))
+        last = self._empty_cells.pop()
+        if pos < len(self._empty_cells):
+            self._empty_cells[pos] = last
+            self._empty_index[last] = pos
+
+    def _free_cell(self, row, col):
+        """
+        Add a cell to the free set.
+        """
+        self._empty_index[(row, col)] = len(self._empty_cells)
+        self._empty_cells.append((row, col))
     
     def __str__(self):
         """
@@ -108,59 +153,150 @@ class TwentyFortyEight:
         """
         Move all tiles in the given direction and add
         a new tile if any tiles moved.
+        Returns the sum of the tiles created by merging.
         """
         moved = False
+        score = 0
         offset = OFFSETS[direction]
         if offset[0] != 0:
             for col_index in range(self.grid_width):
                 value_list = [self.value[row_index][col_index] for row_index in range(self.grid_height)]
-                new_list = self.new_list_gen(value_list, offset, 0)
+                new_list, line_score = self._merge_line(value_list, offset[0] < 0)
+                score += line_score
                 for row_index in range(self.grid_height):
-                    if self.value[row_index][col_index] != new_list[row_index]:
-                        self.value[row_index][col_index] = new_list[row_index]
+                    old = self.value[row_index][col_index]
+                    new = new_list[row_index]
+                    if old != new:
+                        self.value[row_index][col_index] = new
+                        if old == 0:
+                            self._fill_cell(row_index, col_index)
+                        elif new == 0:
+                            self._free_cell(row_index, col_index)
                         moved = True
         else:
             for row_index in range(self.grid_height):
                 value_list = [self.value[row_index][col_index] for col_index in range(self.grid_width)]
-                new_list = self.new_list_gen(value_list, offset, 1)
+                new_list, line_score = self._merge_line(value_list, offset[1] < 0)
+                score += line_score
                 for col_index in range(self.grid_width):
-                    if self.value[row_index][col_index] != new_list[col_index]:
-                        self.value[row_index][col_index] = new_list[col_index]
+                    old = self.value[row_index][col_index]
+                    new = new_list[col_index]
+                    if old != new:
+                        self.value[row_index][col_index] = new
+                        if old == 0:
+                            self._fill_cell(row_index, col_index)
+                        elif new == 0:
+                            self._free_cell(row_index, col_index)
                         moved = True
         if moved:
             self.new_tile()
-        
+        return score
+
+    def successors(self):
+        """
+        Compute the outcome of all four directions without changing
+        the game or adding a new tile.
+
+        Returns a dictionary mapping each direction to a tuple
+        (legal, grid, score), where score is the sum of the merged
+        tiles.  Rows a move leaves unchanged are shared with the
+        current grid, so the grids must be treated as read-only.
+        """
+        result = {}
+        for direction, reverse in ((LEFT, False), (RIGHT, True)):
+            new_grid = []
+            legal = False
+            score = 0
+            for row in self.value:
+                new_row, row_score = self._merge_line(row, reverse)
+                if new_row == row:
+                    new_grid.append(row)
+                else:
+                    new_grid.append(new_row)
+                    legal = True
+                score += row_score
+            result[direction] = (legal, new_grid, score)
+        columns = [list(column) for column in zip(*self.value)]
+        for direction, reverse in ((UP, False), (DOWN, True)):
+            new_columns = []
+            legal = False
+            score = 0
+            for column in columns:
+                new_column, column_score = self._merge_line(column, reverse)
+                if new_column != column:
+                    legal = True
+                new_columns.append(new_column)
+                score += column_score
+            if not legal:
+                result[direction] = (False, self.value, 0)
+                continue
+            new_grid = []
+            for row_index, new_row in enumerate(zip(*new_columns)):
+                new_row = list(new_row)
+                if new_row == self.value[row_index]:
+                    new_grid.append(self.value[row_index])
+                else:
+                    new_grid.append(new_row)
+            result[direction] = (True, new_grid, score)
+        return result
+
+    def legal_moves(self):
+        """
+        Return the list of directions that would change the grid.
+        """
+        outcomes = self.successors()
+        return [direction for direction in (UP, DOWN, LEFT, RIGHT) if outcomes[direction][0]]
+
+    def _merge_line(self, line, reverse):
+        """
+        Merge a copy of line toward its start, or toward its end if
+        reverse is set.  Returns a (new_line, score) tuple.
+        """
+        if not reverse:
+            return merge_with_score(line)
+        line = list(line)
+        line.reverse()
+        new_line, score = merge_with_score(line)
+        new_line.reverse()
+        return new_line, score
     
     def find_empty_tile(self):
         """
-        Find a empty tile randomly
+        Find a empty tile randomly.
+        Returns None if the grid is full.
         """
-        row = random.randrange(0, self.grid_height)
-        col = random.randrange(0, self.grid_width)
-        while self.value[row][col] != 0:
-            row=random.randrange(0, self.grid_height)
-            col=random.randrange(0, self.grid_width)
-        return row, col
+        if not self._empty_cells:
+            return None
+        return self._empty_cells[int(random.random() * len(self._empty_cells))]
         
     def new_tile(self):
         """
         Create a new tile in a randomly selected empty 
         square.  The tile should be 2 90% of the time and
         4 10% of the time.
+        Returns False if there is no empty square.
         """
         seed = random.random()
         if seed < 0.9:
             tile = 2
         else:
             tile = 4
-        row, col = self.find_empty_tile()
-        self.set_tile(row, col, tile)
+        cell = self.find_empty_tile()
+        if cell is None:
+            return False
+        self.set_tile(cell[0], cell[1], tile)
+        return True
         
     def set_tile(self, row, col, value):
         """
         Set the tile at position row, col to have the given value.
         """        
+        old = self.value[row][col]
         self.value[row][col] = value
+        if old == 0 and value != 0:
+            self._fill_cell(row, col)
+        elif old != 0 and value == 0:
+            self._free_cell(row, col)
 
     def get_tile(self, row, col):
         """
@@ -170,4 +306,1067 @@ class TwentyFortyEight:
         return self.value[row][col]
  
     
-poc_2048_gui.run_gui(TwentyFortyEight(4, 4))
\ No newline at end of file
+##################################################################
+# Bitboard backend for the 4x4 game
+#
+# The whole grid is packed into one integer, four bits per tile, where
+# each nibble holds the log2 exponent of the tile (0 for an empty tile).
+# Tile (row, col) lives at nibble 4 * row + col, so every row is a
+# 16-bit chunk and a move is a handful of lookups in 65536-entry tables.
+# Exponents saturate at 15, so the largest representable tile is 32768;
+# a move that would merge two of them is played on the list backend.
+
+BITBOARD_SIZE = 4
+MAX_EXPONENT = 15
+
+_ROW_MASK = 0xFFFF
+
+# row -> row after moving toward nibble 0 (LEFT) or nibble 3 (RIGHT)
+_ROW_LEFT = []
+_ROW_RIGHT = []
+# row read as a column -> column spread over the board after UP or DOWN
+_COL_UP = []
+_COL_DOWN = []
+# row -> tuple of the nibble indices of its empty tiles
+_ROW_EMPTY = []
+# row -> score of moving the row LEFT or RIGHT
+_ROW_SCORE_LEFT = []
+_ROW_SCORE_RIGHT = []
+# rows in which a move merges two tiles of the largest exponent
+_ROW_OVERFLOW = set()
+_NIBBLE_LOW_BITS = 0x1111111111111111
+
+def _unpack_row(row):
+    """
+    Split a 16-bit row into its four exponents.
+    """
+    return [(row >> (4 * idx)) & 0xF for idx in range(BITBOARD_SIZE)]
+
+def _pack_row(exponents):
+    """
+    Pack four exponents into a 16-bit row.
+    """
+    row = 0
+    for idx in range(BITBOARD_SIZE):
+        row |= exponents[idx] << (4 * idx)
+    return row
+
+def _spread_row(row):
+    """
+    Place the four nibbles of a row into one column of a board.
+    """
+    return ((row & 0xF) | ((row >> 4) & 0xF) << 16 |
+            ((row >> 8) & 0xF) << 32 | ((row >> 12) & 0xF) << 48)
+
+def _tile_exponent(tile):
+    """
+    Return the log2 exponent of a tile value, 0 for an empty tile.
+    """
+    exponent = 0
+    while tile > 1:
+        tile >>= 1
+        exponent += 1
+    return exponent
+
+def _exponent_line(line):
+    """
+    Convert a merged line of tile values back into exponents,
+    saturating at MAX_EXPONENT.
+    """
+    return [min(_tile_exponent(tile), MAX_EXPONENT) for tile in line]
+
+def _build_move_tables():
+    """
+    Precompute the row and column transition tables with 'merge'.
+    The tables are shared by every bitboard game and built once.
+    """
+    if _ROW_LEFT:
+        return
+    for row in range(_ROW_MASK + 1):
+        exponents = _unpack_row(row)
+        line = [1 << exp if exp else 0 for exp in exponents]
+        left = _pack_row(_exponent_line(merge(line)))
+        line.reverse()
+        right_line = _exponent_line(merge(line))
+        right_line.reverse()
+        right = _pack_row(right_line)
+        _ROW_LEFT.append(left)
+        _ROW_RIGHT.append(right)
+        _COL_UP.append(_spread_row(left))
+        _COL_DOWN.append(_spread_row(right))
+        _ROW_EMPTY.append(tuple([idx for idx in range(BITBOARD_SIZE) if not exponents[idx]]))
+        _ROW_SCORE_RIGHT.append(merge_with_score(line)[1])
+        line.reverse()
+        _ROW_SCORE_LEFT.append(merge_with_score(line)[1])
+        if max(merge(line)) > 1 << MAX_EXPONENT:
+            _ROW_OVERFLOW.add(row)
+
+def transpose_bitboard(board):
+    """
+    Swap rows and columns of a packed board.
+    """
+    part1 = board & 0xF0F00F0FF0F00F0F
+    part2 = board & 0x0000F0F00000F0F0
+    part3 = board & 0x0F0F00000F0F0000
+    board = part1 | (part2 << 12) | (part3 >> 12)
+    part1 = board & 0xFF00FF0000FF00FF
+    part2 = board & 0x00FF00FF00000000
+    part3 = board & 0x00000000FF00FF00
+    return part1 | (part2 >> 24) | (part3 << 24)
+
+def bitboard_move(board, direction):
+    """
+    Return the packed board after moving all tiles in the given
+    direction.  No new tile is added.
+    """
+    if direction == LEFT or direction == RIGHT:
+        table = _ROW_LEFT if direction == LEFT else _ROW_RIGHT
+        return (table[board & _ROW_MASK] |
+                table[(board >> 16) & _ROW_MASK] << 16 |
+                table[(board >> 32) & _ROW_MASK] << 32 |
+                table[board >> 48] << 48)
+    table = _COL_UP if direction == UP else _COL_DOWN
+    board = transpose_bitboard(board)
+    return (table[board & _ROW_MASK] |
+            table[(board >> 16) & _ROW_MASK] << 4 |
+            table[(board >> 32) & _ROW_MASK] << 8 |
+            table[board >> 48] << 12)
+
+def bitboard_move_score(board, direction):
+    """
+    Return a (new_board, score) tuple for moving a packed board in the
+    given direction, where score is the sum of the merged tiles.
+    """
+    if direction == LEFT or direction == UP:
+        table = _ROW_SCORE_LEFT
+    else:
+        table = _ROW_SCORE_RIGHT
+    rows = board
+    if direction == UP or direction == DOWN:
+        rows = transpose_bitboard(board)
+    score = (table[rows & _ROW_MASK] + table[(rows >> 16) & _ROW_MASK] +
+             table[(rows >> 32) & _ROW_MASK] + table[rows >> 48])
+    return bitboard_move(board, direction), score
+
+def bitboard_overflows(board, direction):
+    """
+    Return True if moving a packed board in the given direction would
+    merge two tiles of exponent MAX_EXPONENT, which cannot be stored.
+    """
+    top = board & (board >> 1) & (board >> 2) & (board >> 3) & _NIBBLE_LOW_BITS
+    if not top:
+        return False
+    if direction == UP or direction == DOWN:
+        board = transpose_bitboard(board)
+    for shift in (0, 16, 32, 48):
+        if (board >> shift) & _ROW_MASK in _ROW_OVERFLOW:
+            return True
+    return False
+
+def bitboard_empty_cells(board):
+    """
+    Return the nibble indices of all empty tiles of a packed board.
+    """
+    cells = []
+    for row in range(BITBOARD_SIZE):
+        base = row * BITBOARD_SIZE
+        cells.extend([base + idx for idx in _ROW_EMPTY[(board >> (16 * row)) & _ROW_MASK]])
+    return cells
+
+class BitboardTwentyFortyEight(TwentyFortyEight):
+    """
+    4x4 game logic on a packed 64-bit board, with the same interface
+    as TwentyFortyEight.
+    """
+
+    def __init__(self):
+        _build_move_tables()
+        self.grid_height = BITBOARD_SIZE
+        self.grid_width = BITBOARD_SIZE
+        self.board = 0
+
+    def reset(self):
+        """
+        Reset the game so the grid is empty.
+        """
+        self.board = 0
+
+    def __str__(self):
+        """
+        Return a string representation of the grid for debugging.
+        """
+        string = ""
+        for row in range(self.grid_height):
+            string += str([self.get_tile(row, col) for col in range(self.grid_width)])
+            string += "\n"
+        return string
+
+    def move(self, direction):
+        """
+        Move all tiles in the given direction and add
+        a new tile if any tiles moved.
+
+        Returns the sum of the tiles created by merging.
+
+        If the move would make a tile larger than the bitboard can
+        hold, the game switches to the list backend first.
+        """
+        if bitboard_overflows(self.board, direction):
+            self._use_list_backend()
+            return self.move(direction)
+        new_board, score = bitboard_move_score(self.board, direction)
+        if new_board != self.board:
+            self.board = new_board
+            self.new_tile()
+        return score
+
+    def _use_list_backend(self):
+        """
+        Turn this game into a TwentyFortyEight with the same tiles.
+        """
+        values = [[self.get_tile(row, col) for col in range(BITBOARD_SIZE)]
+                  for row in range(BITBOARD_SIZE)]
+        del self.board
+        self.__class__ = TwentyFortyEight
+        TwentyFortyEight.__init__(self, BITBOARD_SIZE, BITBOARD_SIZE)
+        for row in range(BITBOARD_SIZE):
+            for col in range(BITBOARD_SIZE):
+                if values[row][col]:
+                    self.set_tile(row, col, values[row][col])
+
+    def successors(self):
+        """
+        Compute the outcome of all four directions without changing
+        the game or adding a new tile.
+
+        Returns a dictionary mapping each direction to a tuple
+        (legal, board, score), where board is the packed result.
+        A board whose move would overflow (see bitboard_overflows)
+        holds the saturated tile, but the score is exact.
+        """
+        result = {}
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            new_board, score = bitboard_move_score(self.board, direction)
+            result[direction] = (new_board != self.board, new_board, score)
+        return result
+
+    def find_empty_tile(self):
+        """
+        Find a empty tile randomly.
+        Returns None if the grid is full.
+        """
+        cells = bitboard_empty_cells(self.board)
+        if not cells:
+            return None
+        idx = random.choice(cells)
+        return idx // BITBOARD_SIZE, idx % BITBOARD_SIZE
+
+    def new_tile(self):
+        """
+        Create a new tile in a randomly selected empty
+        square.  The tile should be 2 90% of the time and
+        4 10% of the time.
+        Returns False if there is no empty square.
+        """
+        if random.random() < 0.9:
+            exponent = 1
+        else:
+            exponent = 2
+        cells = bitboard_empty_cells(self.board)
+        if not cells:
+            return False
+        self.board |= exponent << (4 * random.choice(cells))
+        return True
+
+    def set_tile(self, row, col, value):
+        """
+        Set the tile at position row, col to have the given value.
+        """
+        exponent = _exponent_line([value])[0]
+        assert value == 0 or value == 1 << exponent, "not a storable tile: " + str(value)
+        shift = 4 * (row * BITBOARD_SIZE + col)
+        self.board = (self.board & ~(0xF << shift)) | (exponent << shift)
+
+    def get_tile(self, row, col):
+        """
+        Return the value of the tile at position row, col.
+        """
+        exponent = (self.board >> (4 * (row * BITBOARD_SIZE + col))) & 0xF
+        if exponent == 0:
+            return 0
+        return 1 << exponent
+
+##################################################################
+# Whole-grid backend for very large grids
+#
+# The grid is one byte string of exponents in row-major order.  A move
+# joins every row (or column) with a separator byte and then works on
+# the whole grid at once with C-level string operations: removing the
+# empty bytes compacts all lines, and one replace per exponent merges
+# every pair of equal neighbors.  str.replace scans left to right
+# without overlaps, which is exactly the pairing 'merge' uses.  Merged
+# pairs become marker bytes first, so a new tile cannot merge again in
+# the same move.
+
+LARGE_GRID_CELLS = 4096
+LARGE_MAX_EXPONENT = 62
+
+_EMPTY_BYTE = chr(0)
+_LINE_SEP = chr(255)
+_PAIRS = [chr(exp) * 2 for exp in range(LARGE_MAX_EXPONENT + 1)]
+_MARKS = [chr(64 + exp) for exp in range(LARGE_MAX_EXPONENT + 1)]
+_MERGED = [chr(exp + 1) for exp in range(LARGE_MAX_EXPONENT + 1)]
+
+class LargeTwentyFortyEight(TwentyFortyEight):
+    """
+    Game logic for very large grids, with the same interface as
+    TwentyFortyEight.  Moves cost a few passes over a packed byte
+    string instead of a Python loop per tile.  Spawning scans the grid
+    for empty tiles, which is cheap next to a move at these sizes.
+    """
+
+    def __init__(self, grid_height, grid_width):
+        self.grid_height = grid_height
+        self.grid_width = grid_width
+        self.grid = bytearray(grid_height * grid_width)
+
+    def reset(self):
+        """
+        Reset the game so the grid is empty.
+        """
+        self.grid = bytearray(self.grid_height * self.grid_width)
+
+    def __str__(self):
+        """
+        Return a string representation of the grid for debugging.
+        """
+        string = ""
+        for row in range(self.grid_height):
+            string += str([self.get_tile(row, col) for col in range(self.grid_width)])
+            string += "\n"
+        return string
+
+    def shift_grid(self, direction):
+        """
+        Return a (grid, score) tuple for moving all tiles in the given
+        direction, where grid is the packed result as a string.
+        The game itself is not changed.
+        """
+        grid = str(self.grid)
+        height = self.grid_height
+        width = self.grid_width
+        if direction == UP or direction == DOWN:
+            lines = [grid[col::width] for col in range(width)]
+            length = height
+        else:
+            lines = [grid[row * width:(row + 1) * width] for row in range(height)]
+            length = width
+        joined = _LINE_SEP.join(lines)
+        backward = direction == DOWN or direction == RIGHT
+        if backward:
+            joined = joined[::-1]
+
+        max_exponent = ord(max(grid)) if grid else 0
+        joined = joined.replace(_EMPTY_BYTE, "")
+        score = 0
+        merged = []
+        for exponent in range(1, max_exponent + 1):
+            count = joined.count(_PAIRS[exponent])
+            if count:
+                score += count << (exponent + 1)
+                joined = joined.replace(_PAIRS[exponent], _MARKS[exponent])
+                merged.append(exponent)
+        for exponent in merged:
+            joined = joined.replace(_MARKS[exponent], _MERGED[exponent])
+
+        joined = "".join([line.ljust(length, _EMPTY_BYTE) for line in joined.split(_LINE_SEP)])
+        if backward:
+            joined = joined[::-1]
+        if direction == UP or direction == DOWN:
+            joined = "".join([joined[row::height] for row in range(height)])
+        return joined, score
+
+    def move(self, direction):
+        """
+        Move all tiles in the given direction and add
+        a new tile if any tiles moved.
+        Returns the sum of the tiles created by merging.
+        """
+        new_grid, score = self.shift_grid(direction)
+        if new_grid != str(self.grid):
+            self.grid = bytearray(new_grid)
+            self.new_tile()
+        return score
+
+    def successors(self):
+        """
+        Compute the outcome of all four directions without changing
+        the game or adding a new tile.
+
+        Returns a dictionary mapping each direction to a tuple
+        (legal, grid, score), where grid is the packed result.
+        """
+        current = str(self.grid)
+        result = {}
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            new_grid, score = self.shift_grid(direction)
+            result[direction] = (new_grid != current, new_grid, score)
+        return result
+
+    def find_empty_tile(self):
+        """
+        Find a empty tile randomly.
+        Returns None if the grid is full.
+        """
+        grid = self.grid
+        width = self.grid_width
+        target = grid.count(_EMPTY_BYTE)
+        if not target:
+            return None
+        target = random.randrange(target)
+        for row in range(self.grid_height):
+            start = row * width
+            count = grid.count(_EMPTY_BYTE, start, start + width)
+            if target < count:
+                pos = grid.find(_EMPTY_BYTE, start)
+                for dummy_i in range(target):
+                    pos = grid.find(_EMPTY_BYTE, pos + 1)
+                return row, pos - start
+            target -= count
+
+    def set_tile(self, row, col, value):
+        """
+        Set the tile at position row, col to have the given value.
+        """
+        exponent = _tile_exponent(value)
+        assert value == 0 or value == 1 << exponent, "not a storable tile: " + str(value)
+        assert exponent < LARGE_MAX_EXPONENT, "tile too large: " + str(value)
+        self.grid[row * self.grid_width + col] = exponent
+
+    def get_tile(self, row, col):
+        """
+        Return the value of the tile at position row, col.
+        """
+        exponent = self.grid[row * self.grid_width + col]
+        if exponent == 0:
+            return 0
+        return 1 << exponent
+
+def new_game(grid_height, grid_width):
+    """
+    Create a game, using the bitboard backend for 4x4 grids, the
+    whole-grid backend for grids of at least LARGE_GRID_CELLS tiles
+    and the list backend for every other size.
+    """
+    if grid_height == BITBOARD_SIZE and grid_width == BITBOARD_SIZE:
+        return BitboardTwentyFortyEight()
+    if grid_height * grid_width >= LARGE_GRID_CELLS:
+        return LargeTwentyFortyEight(grid_height, grid_width)
+    return TwentyFortyEight(grid_height, grid_width)
+
+def bitboard_from_game(game):
+    """
+    Return the packed board of a 4x4 game of either backend.
+    """
+    if isinstance(game, BitboardTwentyFortyEight):
+        return game.board
+    assert (game.get_grid_height(), game.get_grid_width()) == (BITBOARD_SIZE, BITBOARD_SIZE), (
+        "bitboard only holds 4x4 games, not " + str(game.get_grid_height()) + "x" +
+        str(game.get_grid_width()))
+    board = 0
+    for row in range(BITBOARD_SIZE):
+        for col in range(BITBOARD_SIZE):
+            exponent = _exponent_line([game.get_tile(row, col)])[0]
+            board |= exponent << (4 * (row * BITBOARD_SIZE + col))
+    return board
+
+##################################################################
+# Expectimax auto-player
+
+# row -> heuristic value of the row, shared by rows and columns
+_ROW_HEURISTIC = []
+
+def _build_heuristic_table():
+    """
+    Precompute the row heuristic: reward empty tiles and adjacent
+    equal tiles, penalize rows that are not monotonic.
+    """
+    if _ROW_HEURISTIC:
+        return
+    for row in range(_ROW_MASK + 1):
+        exponents = _unpack_row(row)
+        empty = exponents.count(0)
+        merges = 0
+        for idx in range(1, BITBOARD_SIZE):
+            if exponents[idx] and exponents[idx] == exponents[idx - 1]:
+                merges += 1
+        mono_left = 0
+        mono_right = 0
+        for idx in range(1, BITBOARD_SIZE):
+            prev = exponents[idx - 1] ** 4
+            cur = exponents[idx] ** 4
+            if exponents[idx - 1] > exponents[idx]:
+                mono_left += prev - cur
+            else:
+                mono_right += cur - prev
+        total = sum([exp ** 3.5 for exp in exponents])
+        _ROW_HEURISTIC.append(200000.0 + 270.0 * empty + 700.0 * merges
+                              - 47.0 * min(mono_left, mono_right) - 11.0 * total)
+
+def bitboard_heuristic(board):
+    """
+    Heuristic value of a packed board, summed over rows and columns.
+    """
+    heur = _ROW_HEURISTIC
+    transposed = transpose_bitboard(board)
+    return (heur[board & _ROW_MASK] + heur[(board >> 16) & _ROW_MASK] +
+            heur[(board >> 32) & _ROW_MASK] + heur[board >> 48] +
+            heur[transposed & _ROW_MASK] + heur[(transposed >> 16) & _ROW_MASK] +
+            heur[(transposed >> 32) & _ROW_MASK] + heur[transposed >> 48])
+
+class ExpectimaxPlayer:
+    """
+    Depth-limited expectimax search on packed 4x4 boards.  Player nodes
+    take the best of the four directions, chance nodes average over the
+    2 (90%) and 4 (10%) spawns of 'new_tile' on every empty tile.
+
+    With a time_budget (seconds), get_move deepens iteratively from
+    depth 1 until the deadline and keeps the deepest completed answer.
+    """
+
+    def __init__(self, depth=2, cache_size=200000, time_budget=None,
+                 min_probability=0.0001):
+        _build_move_tables()
+        _build_heuristic_table()
+        self._depth = depth
+        self._cache_size = cache_size
+        self._time_budget = time_budget
+        self._min_probability = min_probability
+        self._cache = {}
+        self._deadline = None
+        self._next_check = 0
+        self._timed_out = False
+        self.nodes = 0
+        self.cache_lookups = 0
+        self.cache_hits = 0
+        self.depth_reached = 0
+
+    def get_move(self, game):
+        """
+        Return the best direction for the given 4x4 game, or None if
+        no direction changes the board.
+        """
+        return self.search(bitboard_from_game(game))[0]
+
+    def search(self, board):
+        """
+        Search a packed board.  Returns a (direction, value) tuple.
+        """
+        self._cache = {}
+        self._timed_out = False
+        self.nodes = 0
+        self.cache_lookups = 0
+        self.cache_hits = 0
+        self.depth_reached = 0
+        if self._time_budget is None:
+            self._deadline = None
+            best = self._search_root(board, self._depth)
+            self.depth_reached = self._depth
+            return best
+
+        self._deadline = time.time() + self._time_budget
+        self._next_check = 0
+        best = (None, 0.0)
+        depth = 1
+        while True:
+            result = self._search_root(board, depth)
+            if self._timed_out:
+                break
+            best = result
+            self.depth_reached = depth
+            if result[0] is None or time.time() >= self._deadline:
+                break
+            depth += 1
+        return best
+
+    def stats(self):
+        """
+        Return a dictionary with the counters of the last search.
+        """
+        hit_rate = 0.0
+        if self.cache_lookups:
+            hit_rate = float(self.cache_hits) / self.cache_lookups
+        return {"nodes": self.nodes,
+                "cache_lookups": self.cache_lookups,
+                "cache_hits": self.cache_hits,
+                "hit_rate": hit_rate,
+                "depth": self.depth_reached}
+
+    def _search_root(self, board, depth):
+        """
+        Best (direction, value) over the four directions at the root.
+        """
+        best_direction = None
+        best_value = 0.0
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            new_board = bitboard_move(board, direction)
+            if new_board == board:
+                continue
+            value = self._chance_node(new_board, depth, 1.0)
+            if best_direction is None or value > best_value:
+                best_direction = direction
+                best_value = value
+        return best_direction, best_value
+
+    def _max_node(self, board, depth, probability):
+        """
+        Value of a board with the player to move.
+        """
+        self.nodes += 1
+        best_value = 0.0
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            new_board = bitboard_move(board, direction)
+            if new_board != board:
+                best_value = max(best_value, self._chance_node(new_board, depth, probability))
+        return best_value
+
+    def _chance_node(self, board, depth, probability):
+        """
+        Expected value of a board right after a move, before the spawn.
+        'depth' counts the player moves left, including this one.
+        """
+        self.nodes += 1
+        if depth <= 1 or probability < self._min_probability:
+            return bitboard_heuristic(board)
+        if self._deadline is not None and self.nodes >= self._next_check:
+            self._next_check = self.nodes + 256
+            if time.time() >= self._deadline:
+                self._timed_out = True
+        if self._timed_out:
+            return 0.0
+
+        self.cache_lookups += 1
+        entry = self._cache.get(board)
+        if entry is not None and entry[0] >= depth:
+            self.cache_hits += 1
+            return entry[1]
+
+        cells = bitboard_empty_cells(board)
+        share = probability / len(cells)
+        value = 0.0
+        for idx in cells:
+            shift = 4 * idx
+            value += 0.9 * self._max_node(board | (1 << shift), depth - 1, share * 0.9)
+            value += 0.1 * self._max_node(board | (2 << shift), depth - 1, share * 0.1)
+        value /= len(cells)
+
+        if len(self._cache) >= self._cache_size:
+            self._cache.clear()
+        self._cache[board] = (depth, value)
+        return value
+
+##################################################################
+# Batched simulator for many concurrent 4x4 games
+
+class BatchTwentyFortyEight:
+    """
+    Many independent 4x4 games stepped together.  The boards are kept
+    as one list of packed integers and every step applies a whole
+    vector of directions through the shared move tables.
+    """
+
+    def __init__(self, num_games, seed=None):
+        _build_move_tables()
+        self._rng = random.Random(seed)
+        self.num_games = num_games
+        self.boards = [0] * num_games
+        self.scores = [0] * num_games
+        self.reset()
+
+    def reset(self):
+        """
+        Reset every game to an empty grid with two new tiles.
+        """
+        self.boards = [0] * self.num_games
+        self.scores = [0] * self.num_games
+        everyone = range(self.num_games)
+        self.spawn(everyone)
+        self.spawn(everyone)
+
+    def get_tile(self, game, row, col):
+        """
+        Return the value of the tile at position row, col of one game.
+        """
+        exponent = (self.boards[game] >> (4 * (row * BITBOARD_SIZE + col))) & 0xF
+        if exponent == 0:
+            return 0
+        return 1 << exponent
+
+    def spawn(self, games):
+        """
+        Add a new tile to each of the given games, a 2 90% of the time
+        and a 4 10% of the time, on a random empty square.
+        """
+        boards = self.boards
+        randoms = self._rng.random
+        row_empty = _ROW_EMPTY
+        for game in games:
+            board = boards[game]
+            cells = []
+            for row in range(BITBOARD_SIZE):
+                empty = row_empty[(board >> (16 * row)) & _ROW_MASK]
+                if empty:
+                    base = row * BITBOARD_SIZE
+                    cells.extend([base + idx for idx in empty])
+            if not cells:
+                continue
+            idx = cells[int(randoms() * len(cells))]
+            if randoms() < 0.9:
+                boards[game] = board | (1 << (4 * idx))
+            else:
+                boards[game] = board | (2 << (4 * idx))
+
+    def step(self, directions):
+        """
+        Move game i in directions[i] and spawn a tile in every game
+        that changed; games whose direction is None are left alone.
+        Returns a (moved, score_deltas) tuple of lists.
+        """
+        boards = self.boards
+        scores = self.scores
+        moved = [False] * self.num_games
+        deltas = [0] * self.num_games
+        changed = []
+        mask = _ROW_MASK
+        for game in range(self.num_games):
+            direction = directions[game]
+            if direction is None:
+                continue
+            board = boards[game]
+            if direction == LEFT or direction == UP:
+                table = _ROW_LEFT
+                score_table = _ROW_SCORE_LEFT
+            else:
+                table = _ROW_RIGHT
+                score_table = _ROW_SCORE_RIGHT
+            if direction == UP or direction == DOWN:
+                rows = transpose_bitboard(board)
+            else:
+                rows = board
+            row0 = rows & mask
+            row1 = (rows >> 16) & mask
+            row2 = (rows >> 32) & mask
+            row3 = rows >> 48
+            new_rows = (table[row0] | table[row1] << 16 |
+                        table[row2] << 32 | table[row3] << 48)
+            if new_rows == rows:
+                continue
+            if direction == UP or direction == DOWN:
+                new_rows = transpose_bitboard(new_rows)
+            boards[game] = new_rows
+            delta = score_table[row0] + score_table[row1] + score_table[row2] + score_table[row3]
+            deltas[game] = delta
+            scores[game] += delta
+            moved[game] = True
+            changed.append(game)
+        self.spawn(changed)
+        return moved, deltas
+
+    def game_over(self):
+        """
+        Return a list of flags, True for games with no legal move.
+        """
+        over = []
+        for board in self.boards:
+            over.append(bitboard_move(board, LEFT) == board and
+                        bitboard_move(board, RIGHT) == board and
+                        bitboard_move(board, UP) == board and
+                        bitboard_move(board, DOWN) == board)
+        return over
+
+def play_random_batch(num_games, seed=None):
+    """
+    Play num_games random games to completion in one batch.  Returns
+    a (scores, max_tiles) tuple of lists and prints games per second.
+    """
+    start = time.time()
+    batch = BatchTwentyFortyEight(num_games, seed)
+    rng = random.Random(seed)
+    directions = (UP, DOWN, LEFT, RIGHT)
+    active = range(num_games)
+    while active:
+        moves = [None] * num_games
+        for game in active:
+            moves[game] = directions[int(rng.random() * 4)]
+        moved = batch.step(moves)[0]
+        still_active = []
+        for game in active:
+            board = batch.boards[game]
+            if moved[game] or not (bitboard_move(board, LEFT) == board and
+                                   bitboard_move(board, RIGHT) == board and
+                                   bitboard_move(board, UP) == board and
+                                   bitboard_move(board, DOWN) == board):
+                still_active.append(game)
+        active = still_active
+    max_tiles = []
+    for board in batch.boards:
+        exponent = max([(board >> (4 * idx)) & 0xF for idx in range(16)])
+        max_tiles.append(1 << exponent)
+    elapsed = time.time() - start
+    print num_games, "games in", round(elapsed, 2), "seconds,", int(num_games / elapsed), "games/sec"
+    return batch.scores, max_tiles
+
+def benchmark_move(num_moves=20000):
+    """
+    Compare move throughput of the list and bitboard backends on the
+    same stream of random 4x4 positions.  Returns moves per second for
+    each backend.
+    """
+    rng = random.Random(2048)
+    positions = []
+    game = TwentyFortyEight(4, 4)
+    while len(positions) < num_moves:
+        game.reset()
+        game.new_tile()
+        game.new_tile()
+        for dummy_step in range(200):
+            positions.append([list(row) for row in game.value])
+            game.move(rng.choice((UP, DOWN, LEFT, RIGHT)))
+    positions = positions[:num_moves]
+    directions = [rng.choice((UP, DOWN, LEFT, RIGHT)) for dummy_i in range(num_moves)]
+    bit_game = BitboardTwentyFortyEight()
+    packed = []
+    games = []
+    for grid in positions:
+        bit_game.reset()
+        game = TwentyFortyEight(4, 4)
+        for row in range(4):
+            for col in range(4):
+                bit_game.set_tile(row, col, grid[row][col])
+                game.set_tile(row, col, grid[row][col])
+        packed.append(bit_game.board)
+        games.append(game)
+
+    start = time.time()
+    for idx in range(num_moves):
+        games[idx].move(directions[idx])
+    list_rate = num_moves / (time.time() - start)
+
+    start = time.time()
+    for idx in range(num_moves):
+        bit_game.board = packed[idx]
+        bit_game.move(directions[idx])
+    bit_rate = num_moves / (time.time() - start)
+
+    start = time.time()
+    for idx in range(num_moves):
+        bitboard_move(packed[idx], directions[idx])
+    raw_rate = num_moves / (time.time() - start)
+    print "list backend:", int(list_rate), "moves/sec"
+    print "bitboard backend:", int(bit_rate), "moves/sec", "(%.1fx)" % (bit_rate / list_rate)
+    print "bitboard_move alone:", int(raw_rate), "moves/sec", "(%.1fx)" % (raw_rate / list_rate)
+    return list_rate, bit_rate
+
+def benchmark_large_move(sizes=(100, 1000, 4000), num_moves=8):
+    """
+    Time moves of the whole-grid backend on half-filled square grids
+    of the given sizes, next to the list backend where that is
+    affordable.  Returns a list of (size, moves_per_sec) tuples.
+    """
+    rng = random.Random(6)
+    directions = (UP, LEFT, DOWN, RIGHT)
+    results = []
+    for size in sizes:
+        game = LargeTwentyFortyEight(size, size)
+        game.grid = bytearray([rng.choice((0, 0, 1, 2, 3, 4)) for dummy_i in range(size * size)])
+        start = time.time()
+        for idx in range(num_moves):
+            game.move(directions[idx % 4])
+        rate = num_moves / (time.time() - start)
+        line = "%dx%d: %.2f moves/sec" % (size, size, rate)
+        if size <= 1000:
+            list_game = TwentyFortyEight(size, size)
+            for row in range(size):
+                for col in range(size):
+                    list_game.set_tile(row, col, game.get_tile(row, col))
+            list_moves = max(1, num_moves // 4)
+            start = time.time()
+            for idx in range(list_moves):
+                list_game.move(directions[idx % 4])
+            line += ", list backend %.2f moves/sec" % (list_moves / (time.time() - start))
+        print line
+        results.append((size, rate))
+    return results
+
+def benchmark_spawn(grid_height=64, grid_width=64, fill_ratios=(0.0, 0.5, 0.9, 0.99, 0.999),
+                    num_spawns=20000):
+    """
+    Time new_tile on grids filled to each of the given ratios, next to
+    the rejection sampling it replaced.  Returns a list of
+    (fill_ratio, free_set_usec, rejection_usec) tuples.
+    """
+    rng = random.Random(4)
+    results = []
+    for ratio in fill_ratios:
+        game = TwentyFortyEight(grid_height, grid_width)
+        cells = [(row, col) for row in range(grid_height) for col in range(grid_width)]
+        rng.shuffle(cells)
+        num_filled = min(int(ratio * len(cells)), len(cells) - 1)
+        for row, col in cells[:num_filled]:
+            game.set_tile(row, col, 2)
+
+        start = time.time()
+        for dummy_i in range(num_spawns):
+            row, col = game.find_empty_tile()
+            game.set_tile(row, col, 2)
+            game.set_tile(row, col, 0)
+        free_set = (time.time() - start) / num_spawns * 1e6
+
+        start = time.time()
+        for dummy_i in range(num_spawns):
+            row = random.randrange(0, grid_height)
+            col = random.randrange(0, grid_width)
+            while game.value[row][col] != 0:
+                row = random.randrange(0, grid_height)
+                col = random.randrange(0, grid_width)
+        rejection = (time.time() - start) / num_spawns * 1e6
+        print "fill %.3f: free set %.2f usec/spawn, rejection sampling %.2f usec/spawn" % (
+            ratio, free_set, rejection)
+        results.append((ratio, free_set, rejection))
+    return results
+
+##################################################################
+# Headless self-play tournament
+
+def _random_policy():
+    """
+    Policy that plays a uniformly random legal direction.
+    """
+    def policy(game):
+        """
+        Pick a random legal direction, or None if there is none.
+        """
+        moves = game.legal_moves()
+        if not moves:
+            return None
+        return random.choice(moves)
+    return policy
+
+def _greedy_policy():
+    """
+    Policy that plays the legal direction with the largest merge score.
+    """
+    def policy(game):
+        """
+        Pick the best scoring legal direction, or None if there is none.
+        """
+        best = None
+        best_score = -1
+        outcomes = game.successors()
+        for direction in (UP, LEFT, RIGHT, DOWN):
+            legal, dummy_grid, score = outcomes[direction]
+            if legal and score > best_score:
+                best = direction
+                best_score = score
+        return best
+    return policy
+
+def _expectimax_policy():
+    """
+    Policy backed by a depth 2 ExpectimaxPlayer.
+    """
+    return ExpectimaxPlayer(depth=2).get_move
+
+# name -> factory returning a fresh policy(game) -> direction function
+STRATEGIES = {"random": _random_policy,
+              "greedy": _greedy_policy,
+              "expectimax": _expectimax_policy}
+
+def play_game(strategy, seed, grid_height=4, grid_width=4):
+    """
+    Play one game with the named strategy until no direction is legal.
+    Returns a dictionary with the max tile, score, moves and wall time.
+    """
+    start = time.time()
+    random.seed(seed)
+    policy = STRATEGIES[strategy]()
+    game = new_game(grid_height, grid_width)
+    game.new_tile()
+    game.new_tile()
+    score = 0
+    moves = 0
+    while True:
+        direction = policy(game)
+        if direction is None:
+            break
+        score += game.move(direction)
+        moves += 1
+    max_tile = max([game.get_tile(row, col) for row in range(grid_height)
+                    for col in range(grid_width)])
+    return {"strategy": strategy, "seed": seed, "max_tile": max_tile,
+            "score": score, "moves": moves, "seconds": round(time.time() - start, 4)}
+
+def _play_task(task):
+    """
+    Pool worker: unpack a (strategy, seed) task and play it.
+    """
+    return play_game(task[0], task[1])
+
+TOURNAMENT_FIELDS = ("strategy", "seed", "max_tile", "score", "moves", "seconds")
+
+def run_tournament(strategies, games_per_strategy, log_path, processes=None, seed=0):
+    """
+    Play games_per_strategy games for each named strategy across a
+    process pool and stream one record per game to log_path, as CSV
+    if the name ends in .csv and as JSON lines otherwise.
+
+    Game i of a strategy always uses the same seed, so results do not
+    depend on the number of processes or the order games finish in.
+    Returns the list of records.
+    """
+    import json
+    import multiprocessing
+
+    tasks = []
+    for strategy in strategies:
+        assert strategy in STRATEGIES, "unknown strategy: " + strategy
+        for index in range(games_per_strategy):
+            tasks.append((strategy, seed * 1000003 + index))
+    as_csv = log_path.endswith(".csv")
+    records = []
+    start = time.time()
+    # Build the shared tables once so forked workers inherit them.
+    _build_move_tables()
+    _build_heuristic_table()
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    chunk = max(1, len(tasks) // (processes * 8))
+    pool = multiprocessing.Pool(processes)
+    log_file = open(log_path, "w")
+    try:
+        if as_csv:
+            log_file.write(",".join(TOURNAMENT_FIELDS) + "\n")
+        for record in pool.imap_unordered(_play_task, tasks, chunk):
+            if as_csv:
+                log_file.write(",".join([str(record[field]) for field in TOURNAMENT_FIELDS]) + "\n")
+            else:
+                log_file.write(json.dumps(record, sort_keys=True) + "\n")
+            records.append(record)
+    finally:
+        log_file.close()
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start
+
+    print len(records), "games in", round(elapsed, 2), "seconds,", round(len(records) / elapsed, 2), "games/sec"
+    for strategy in strategies:
+        mine = [record for record in records if record["strategy"] == strategy]
+        print "%s: mean score %.1f, best tile %d, mean moves %.1f" % (
+            strategy, float(sum([record["score"] for record in mine])) / len(mine),
+            max([record["max_tile"] for record in mine]),
+            float(sum([record["moves"] for record in mine])) / len(mine))
+    return records
+
+if __name__ == "__main__":
+    import poc_2048_gui
+    poc_2048_gui.run_gui(new_game(4, 4))
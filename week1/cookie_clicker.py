@@ -3,8 +3,11 @@ Cookie Clicker Simulator
 """
 
 import simpleplot
+import array
+import bisect
 import math
 import random
+import time
 
 # Used to increase the timeout, if necessary
 import codeskulptor
@@ -15,17 +18,112 @@ import poc_clicker_provided as provided
 # Constants
 SIM_TIME = 10000000000.0
 
-class ClickerState:
+class PurchaseHistory(object):
+    """
+    Compact purchase history.  Times, costs and totals are kept in
+    typed arrays, item names are interned to small integer ids, and
+    consecutive purchases of the same item share one run-length entry.
+
+    Only every sample_every-th purchase is recorded; 0 records none.
+    The initial entry is always kept.
+    """
+
+    __slots__ = ("_times", "_costs", "_totals", "_names", "_name_ids",
+                 "_run_items", "_run_lengths", "_sample_every", "_purchases")
+
+    def __init__(self, sample_every = 1):
+        self._times = array.array("d")
+        self._costs = array.array("d")
+        self._totals = array.array("d")
+        self._names = []
+        self._name_ids = {}
+        self._run_items = array.array("i")
+        self._run_lengths = array.array("l")
+        self._sample_every = sample_every
+        self._purchases = 0
+
+    def append(self, entry_time, item, cost, total):
+        """
+        Record a purchase, subject to sampling
+        """
+        if item != None:
+            self._purchases += 1
+            if not self._sample_every or self._purchases % self._sample_every:
+                return
+        item_id = self._name_ids.get(item)
+        if item_id == None:
+            item_id = len(self._names)
+            self._name_ids[item] = item_id
+            self._names.append(item)
+        if self._run_items and self._run_items[-1] == item_id:
+            self._run_lengths[-1] += 1
+        else:
+            self._run_items.append(item_id)
+            self._run_lengths.append(1)
+        self._times.append(entry_time)
+        self._costs.append(cost)
+        self._totals.append(total)
+
+    def __len__(self):
+        return len(self._times)
+
+    def __iter__(self):
+        """
+        Yield the recorded (time, item, cost of item, total cookies) tuples
+        """
+        index = 0
+        for run in range(len(self._run_items)):
+            item = self._names[self._run_items[run]]
+            for dummy_i in range(self._run_lengths[run]):
+                yield (self._times[index], item, self._costs[index], self._totals[index])
+                index += 1
+
+    def __str__(self):
+        """
+        Return the entries, abbreviated in the middle for long histories
+        """
+        if len(self) <= 10:
+            return str(list(self))
+        head = []
+        for entry in self:
+            head.append(entry)
+            if len(head) == 3:
+                break
+        return (str(head)[:-1] + ", ... " + str(len(self) - 6) +
+                " more ..., " + str(self._tail(3))[1:])
+
+    def _tail(self, count):
+        """
+        Return the last count entries, read backward from the runs
+        """
+        entries = []
+        index = len(self._times)
+        run = len(self._run_items) - 1
+        while len(entries) < count and run >= 0:
+            item = self._names[self._run_items[run]]
+            for dummy_i in range(min(self._run_lengths[run], count - len(entries))):
+                index -= 1
+                entries.append((self._times[index], item, self._costs[index], self._totals[index]))
+            run -= 1
+        entries.reverse()
+        return entries
+
+
+class ClickerState(object):
     """
     Simple class to keep track of the game state.
     """
+
+    __slots__ = ("_total_cookie_num", "_current_cookie_num", "_current_time", "_cps", "_history")
     
-    def __init__(self, total_cookie_num = 0.0, current_cookie_num = 0.0, current_time = 0.0, cps = 1.0):
+    def __init__(self, total_cookie_num = 0.0, current_cookie_num = 0.0, current_time = 0.0, cps = 1.0,
+                 history_every = 1):
         self._total_cookie_num = total_cookie_num
         self._current_cookie_num = current_cookie_num
         self._current_time = current_time
         self._cps = cps
-        self._history = [(0.0, None, 0.0, 0.0)]
+        self._history = PurchaseHistory(history_every)
+        self._history.append(0.0, None, 0.0, 0.0)
         
     def __str__(self):
         """
@@ -47,6 +145,14 @@ class ClickerState:
         """
         return self._current_cookie_num
     
+    def get_total_cookies(self):
+        """
+        Return total number of cookies produced so far
+
+        Should return a float
+        """
+        return self._total_cookie_num
+
     def get_cps(self):
         """
         Get current CPS
@@ -71,8 +177,17 @@ class ClickerState:
         (time, item, cost of item, total cookies)
 
         For example: (0.0, None, 0.0, 0.0)
+
+        Builds a new list from the compact history on every call; use
+        iter_history to walk a long history without copying it.
+        """
+        return list(self._history)
+
+    def iter_history(self):
+        """
+        Iterate over the history tuples without building a list
         """
-        return self._history
+        return iter(self._history)
 
     def time_until(self, cookies):
         """
@@ -107,17 +222,208 @@ class ClickerState:
             return
         self._current_cookie_num -= cost
         self._cps += additional_cps
-        self._history.append((self._current_time, item_name, cost, self._total_cookie_num))
-   
-    
-def simulate_clicker(build_info, duration, strategy):
+        self._history.append(self._current_time, item_name, cost, self._total_cookie_num)
+
+    def buy_items(self, item_name, cost, additional_cps, count, growth, end_time = None):
+        """
+        Buy up to count copies of an item one after another, where the
+        first copy costs cost and each further copy costs growth times
+        the one before, waiting for the cookies each copy needs, and
+        update state
+
+        The state is kept in local variables for the whole run, and
+        copies that are affordable without waiting are paid for in one
+        step with the closed-form geometric sum.  Stops before a copy
+        whose wait would go past end_time (no limit when None).
+        Returns the number of copies bought.
+        """
+        now = self._current_time
+        cookies = self._current_cookie_num
+        total = self._total_cookie_num
+        cps = self._cps
+        append = self._history.append
+        price = cost
+        bought = 0
+        while bought < count:
+            if cookies < price:
+                delay = math.ceil((price - cookies) / cps)
+                if end_time != None and now + delay > end_time:
+                    break
+                now += delay
+                cookies += delay * cps
+                total += delay * cps
+                if cookies < price:
+                    break
+            if cookies < price * (1.0 + growth):
+                cookies -= price
+                cps += additional_cps
+                append(now, item_name, price, total)
+                price *= growth
+                bought += 1
+                continue
+            chunk = min(count - bought, max_affordable(cookies, price, growth))
+            cookies -= geometric_cost(price, chunk, growth)
+            cps += chunk * additional_cps
+            for dummy_i in range(chunk):
+                append(now, item_name, price, total)
+                price *= growth
+            bought += chunk
+        self._current_time = now
+        self._current_cookie_num = cookies
+        self._total_cookie_num = total
+        self._cps = cps
+        return bought
+
+
+class IndexedBuildInfo:
+    """
+    BuildInfo wrapper that keeps the items sorted by current cost, so
+    the cheapest and the most expensive affordable item are found by
+    binary search.  The index is updated on every update_item.
+    """
+
+    def __init__(self, build_info):
+        self._build_info = build_info
+        pairs = sorted([(build_info.get_cost(item), item) for item in build_info.build_items()])
+        self._costs = [pair[0] for pair in pairs]
+        self._items = [pair[1] for pair in pairs]
+
+    def build_items(self):
+        """
+        Get a list of buildable items
+        """
+        return self._build_info.build_items()
+
+    def get_cost(self, item):
+        """
+        Get the current cost of an item
+        """
+        return self._build_info.get_cost(item)
+
+    def get_cps(self, item):
+        """
+        Get the current CPS of an item
+        """
+        return self._build_info.get_cps(item)
+
+    def update_item(self, item, count = 1):
+        """
+        Update the cost of an item by the growth factor, count times,
+        and move it to its new place in the index
+        """
+        position = bisect.bisect_left(self._costs, self._build_info.get_cost(item))
+        while self._items[position] != item:
+            position += 1
+        del self._costs[position]
+        del self._items[position]
+        for dummy_i in range(count):
+            self._build_info.update_item(item)
+        cost = self._build_info.get_cost(item)
+        position = bisect.bisect_right(self._costs, cost)
+        self._costs.insert(position, cost)
+        self._items.insert(position, item)
+
+    def clone(self):
+        """
+        Return a clone of this IndexedBuildInfo
+        """
+        return IndexedBuildInfo(self._build_info.clone())
+
+    def cheapest_other_cost(self, item):
+        """
+        Return the lowest cost among the items other than item
+        """
+        for position in range(len(self._items)):
+            if self._items[position] != item:
+                return self._costs[position]
+        return float("inf")
+
+    def cheapest_affordable(self, budget):
+        """
+        Return the cheapest item costing at most budget, or None
+        """
+        if self._costs and self._costs[0] <= budget:
+            return self._items[0]
+        return None
+
+    def most_expensive_affordable(self, budget):
+        """
+        Return the most expensive item costing at most budget, or None
+        """
+        position = bisect.bisect_right(self._costs, budget)
+        if position == 0:
+            return None
+        return self._items[position - 1]
+
+
+def geometric_cost(cost, count, growth):
+    """
+    Return the total cost of count copies of an item whose first copy
+    costs cost and whose price is multiplied by growth after each buy.
+    """
+    if growth == 1.0:
+        return cost * count
+    return cost * (growth ** count - 1.0) / (growth - 1.0)
+
+def max_affordable(cookies, cost, growth):
+    """
+    Return how many consecutive copies of an item costing cost, with
+    price growth factor growth, can be bought with cookies.
+    """
+    if cost > cookies:
+        return 0
+    if growth == 1.0:
+        count = int(cookies / cost)
+    else:
+        count = int(math.log(1.0 + cookies * (growth - 1.0) / cost) / math.log(growth))
+    # Correct for rounding in the logarithm.
+    while count > 0 and geometric_cost(cost, count, growth) > cookies:
+        count -= 1
+    while geometric_cost(cost, count + 1, growth) <= cookies:
+        count += 1
+    return count
+
+def copies_below(cost, growth, max_cost):
+    """
+    Return how many consecutive copies of an item costing cost, with
+    price growth factor growth, cost less than max_cost.
+    """
+    if cost >= max_cost:
+        return 0
+    if max_cost == float("inf") or growth <= 1.0:
+        return float("inf")
+    count = int(math.log(max_cost / cost) / math.log(growth))
+    # Correct for rounding in the logarithm.
+    while count > 0 and cost * growth ** (count - 1) >= max_cost:
+        count -= 1
+    while cost * growth ** count < max_cost:
+        count += 1
+    return count
+
+
+def simulate_clicker(build_info, duration, strategy, bulk=False, history_every=1):
     """
     Function to run a Cookie Clicker game for the given
     duration with the given strategy.  Returns a ClickerState
     object corresponding to game.
+
+    history_every is passed to ClickerState: record every n-th
+    purchase, or none with 0.
+
+    With bulk set and a strategy listed in RUN_LIMITS, once the
+    strategy picks the same item twice in a row the rest of the run
+    of that item, waits included, is bought with
+    ClickerState.buy_items without asking the strategy, and the build
+    info is updated once per run.  Strategies that switch items every
+    purchase pay only one comparison per purchase.  The result
+    matches the one-by-one loop to floating point tolerance.
     """
     build = build_info
-    clicker = ClickerState()
+    clicker = ClickerState(history_every=history_every)
+    run_limit = None
+    if bulk:
+        run_limit = RUN_LIMITS.get(strategy)
+    previous = None
     while clicker.get_time() <= duration:
         time_left = duration - clicker.get_time()
         item_name = strategy(clicker.get_cookies(), clicker.get_cps(), time_left, build_info)
@@ -126,10 +432,26 @@ def simulate_clicker(build_info, duration, strategy):
         item_cost = build.get_cost(item_name)
         if clicker.time_until(item_cost) > time_left:
             break
+        clicker.wait(clicker.time_until(item_cost))
+        item_cps = build.get_cps(item_name)
+        build.update_item(item_name)
+        clicker.buy_item(item_name, item_cost, item_cps)
+        if run_limit == None or item_name != previous:
+            previous = item_name
+            continue
+        max_cost = run_limit(clicker.get_cookies(), clicker.get_cps(),
+                             duration - clicker.get_time(), build_info, item_name)
+        next_cost = build.get_cost(item_name)
+        if next_cost >= max_cost:
+            continue
+        growth = next_cost / item_cost
+        count = copies_below(next_cost, growth, max_cost)
+        bought = clicker.buy_items(item_name, next_cost, item_cps, count, growth, duration)
+        if isinstance(build, IndexedBuildInfo):
+            build.update_item(item_name, bought)
         else:
-            clicker.wait(clicker.time_until(item_cost))
-            clicker.buy_item(item_name, item_cost, build.get_cps(item_name))
-            build.update_item(item_name)
+            for dummy_i in range(bought):
+                build.update_item(item_name)
     clicker.wait(time_left)
     return clicker
 
@@ -158,13 +480,16 @@ def strategy_cheap(cookies, cps, time_left, build_info):
     """
     Cheap strategy
     """
+    budget = cookies + cps * time_left
+    if isinstance(build_info, IndexedBuildInfo):
+        return build_info.cheapest_affordable(budget)
     item_list = build_info.build_items()
     min_cost = float('Inf')
     item_to_select = None
     for item in item_list:
         cost = build_info.get_cost(item)
-        if cost > cookies + cps * time_left:
-            break
+        if cost > budget:
+            continue
         if cost < min_cost:
             min_cost = cost
             item_to_select = item
@@ -174,13 +499,16 @@ def strategy_expensive(cookies, cps, time_left, build_info):
     """
     Expensive strategy
     """
+    budget = cookies + cps * time_left
+    if isinstance(build_info, IndexedBuildInfo):
+        return build_info.most_expensive_affordable(budget)
     item_list = build_info.build_items()
     max_cost = -1
     item_to_select = None
     for item in item_list:
         cost = build_info.get_cost(item)
-        if cost > cookies + cps * time_left:
-            break
+        if cost > budget:
+            continue
         if cost > max_cost:
             max_cost = cost
             item_to_select = item
@@ -204,6 +532,443 @@ def strategy_best(cookies, cps, time_left, build_info):
             break
         return item
         
+def cursor_run_limit(cookies, cps, time_left, build_info, item):
+    """
+    strategy_cursor picks Cursor whatever it costs
+    """
+    return float("inf")
+
+def cheap_run_limit(cookies, cps, time_left, build_info, item):
+    """
+    strategy_cheap keeps picking item while it costs less than every
+    other item
+    """
+    if isinstance(build_info, IndexedBuildInfo):
+        return build_info.cheapest_other_cost(item)
+    costs = [build_info.get_cost(other) for other in build_info.build_items() if other != item]
+    return min(costs + [float("inf")])
+
+# Cost below which a strategy keeps picking the item it just picked,
+# for simulate_clicker(bulk=True)
+RUN_LIMITS = {strategy_cursor: cursor_run_limit,
+              strategy_cheap: cheap_run_limit}
+
+def item_tables(build_info):
+    """
+    Read the items of build_info into plain lists.
+
+    Returns a tuple (items, costs, cps values, growth factors).  The
+    growth factor of each item is measured on a clone, so build_info
+    itself is not modified.
+    """
+    items = list(build_info.build_items())
+    costs = [build_info.get_cost(item) for item in items]
+    item_cps = [build_info.get_cps(item) for item in items]
+    probe = build_info.clone()
+    growths = []
+    for index in range(len(items)):
+        probe.update_item(items[index])
+        growths.append(probe.get_cost(items[index]) / costs[index])
+    return items, costs, item_cps, growths
+
+def make_plan_strategy(plan):
+    """
+    Turn a build order into a strategy function that returns the
+    items of plan one call at a time, then None.
+    """
+    position = [0]
+    def strategy_plan(cookies, cps, time_left, build_info):
+        """
+        Next item of the build order
+        """
+        if position[0] >= len(plan):
+            return None
+        item = plan[position[0]]
+        position[0] += 1
+        return item
+    return strategy_plan
+
+def optimize_build_order(build_info, duration, time_bucket=1.0, max_nodes=None, max_seconds=None):
+    """
+    Search all build orders with branch and bound for the one that
+    ends with the most total cookies after duration, using the same
+    arithmetic as simulate_clicker.  build_info is not modified.
+
+    A branch is cut when an upper bound on its final total cookies
+    cannot beat the best order found so far.  The bound lets every
+    cookie buy cps at the best cps/cost ratio left, the moment it is
+    earned, which no real order can outdo.  With the default bucket
+    of 1, states are memoized on (purchase counts, time), and a state
+    that reaches the same key with no more cookies is dropped; this is
+    exact, as all purchase times are whole numbers.
+
+    With a larger bucket, a state is also dropped when another state
+    in the same time // time_bucket bucket had at least as much cps
+    and at least as many cookies once both are moved to the same time,
+    whatever was bought.  This trades optimality for speed.
+
+    The search stops after max_nodes nodes or max_seconds seconds, if
+    given, and returns the best order found so far.
+
+    Returns a tuple (total cookies, build order, stats) where stats
+    is a dictionary with the nodes explored, the runtime and whether
+    the result is known to be optimal (exact bucket, search finished).
+    """
+    start = time.time()
+    items, costs, item_cps, growths = item_tables(build_info)
+
+    best = {"total": -1.0, "plan": []}
+    stats = {"nodes": 0, "pruned": 0, "optimal": time_bucket <= 1.0}
+    seen = {}
+    fronts = {}
+    plan = []
+    limits = {"stopped": False, "next_check": 1024}
+
+    def upper_bound(total, cookies, cps, time_left, current_costs):
+        """
+        Final total if every cookie bought cps at the best ratio left
+        """
+        ratio = max([item_cps[index] / current_costs[index] for index in range(len(items))])
+        if ratio <= 0.0:
+            return total + cps * time_left
+        exponent = ratio * time_left
+        if exponent > 700.0:
+            return float("inf")
+        return total + (cps + ratio * cookies) * (math.exp(exponent) - 1.0) / ratio
+
+    def out_of_budget():
+        """
+        Check the node and time budgets
+        """
+        if max_nodes != None and stats["nodes"] >= max_nodes:
+            limits["stopped"] = True
+        elif max_seconds != None and stats["nodes"] >= limits["next_check"]:
+            limits["next_check"] += 1024
+            if time.time() - start >= max_seconds:
+                limits["stopped"] = True
+        return limits["stopped"]
+
+    def dominated(now, cookies, cps):
+        """
+        Check and update the (cps, cookies) front of the bucket of now
+        """
+        bucket = int(now // time_bucket)
+        # Cookies moved to the start of the bucket, so states at
+        # different times in the bucket compare fairly.
+        level = cookies - cps * (now - bucket * time_bucket)
+        front = fronts.setdefault(bucket, [])
+        for other_cps, other_level in front:
+            if other_cps >= cps and other_level >= level:
+                return True
+        front[:] = [entry for entry in front if entry[0] > cps or entry[1] > level]
+        front.append((cps, level))
+        return False
+
+    # Depth-first search with an explicit stack, as a run can buy far
+    # more items than the recursion limit allows.  Each frame is a
+    # state (counts, now, cookies, cps, total, costs, plan_len) and
+    # the item bought to reach it, which goes at plan[plan_len - 1].
+    stack = [(tuple([0] * len(items)), 0.0, 0.0, 1.0, 0.0, costs, 0, None)]
+    while stack:
+        counts, now, cookies, cps, total, current_costs, plan_len, item = stack.pop()
+        del plan[max(plan_len - 1, 0):]
+        if item != None:
+            plan.append(item)
+        if out_of_budget():
+            break
+        stats["nodes"] += 1
+        time_left = duration - now
+        final = total + cps * time_left
+        if final > best["total"]:
+            best["total"] = final
+            best["plan"] = list(plan)
+        if upper_bound(total, cookies, cps, time_left, current_costs) <= best["total"]:
+            stats["pruned"] += 1
+            continue
+        key = (counts, int(now // time_bucket))
+        if seen.get(key, -1.0) >= cookies:
+            stats["pruned"] += 1
+            continue
+        seen[key] = cookies
+        if time_bucket > 1.0 and dominated(now, cookies, cps):
+            stats["pruned"] += 1
+            continue
+
+        children = []
+        for index in range(len(items)):
+            cost = current_costs[index]
+            if cost > cookies:
+                wait = math.ceil((cost - cookies) / cps)
+            else:
+                wait = 0.0
+            if wait > time_left:
+                continue
+            children.append((-item_cps[index] / cost, index, wait))
+        # Push the best ratio last, so it is searched first.
+        children.sort(reverse=True)
+        for dummy_ratio, index, wait in children:
+            next_counts = counts[:index] + (counts[index] + 1,) + counts[index + 1:]
+            next_costs = list(current_costs)
+            next_costs[index] = current_costs[index] * growths[index]
+            stack.append((next_counts, now + wait, cookies + wait * cps - current_costs[index],
+                          cps + item_cps[index], total + wait * cps, next_costs,
+                          plan_len + 1, items[index]))
+
+    if limits["stopped"]:
+        stats["optimal"] = False
+    stats["seconds"] = time.time() - start
+    return best["total"], best["plan"], stats
+
+def simulate_best_fast(tables, duration, rng):
+    """
+    Run one game of strategy_best and return its final total cookies.
+
+    tables is the tuple returned by item_tables.  The game state is
+    kept in local variables and one cost list instead of ClickerState
+    and BuildInfo objects, with the same arithmetic as
+    simulate_clicker.  Random item choices come from rng.
+    """
+    dummy_items, base_costs, item_cps, growths = tables
+    num_items = len(base_costs)
+    costs = list(base_costs)
+    now = 0.0
+    cookies = 0.0
+    total = 0.0
+    cps = 1.0
+    while True:
+        time_left = duration - now
+        index = int(rng.random() * num_items)
+        cost = costs[index]
+        if cost > cookies + cps * time_left:
+            break
+        if cost > cookies:
+            wait = math.ceil((cost - cookies) / cps)
+            if wait > time_left:
+                break
+            now += wait
+            cookies += wait * cps
+            total += wait * cps
+        cookies -= cost
+        cps += item_cps[index]
+        costs[index] = cost * growths[index]
+    return total + time_left * cps
+
+def simulate_best_runs(build_info, duration, num_runs, seed=None):
+    """
+    Run num_runs games of strategy_best one after another with
+    simulate_best_fast and return the list of final total cookies.
+    build_info is not modified.  All runs draw from one generator
+    seeded with seed.
+    """
+    tables = item_tables(build_info)
+    rng = random.Random(seed)
+    return [simulate_best_fast(tables, duration, rng) for dummy_run in range(num_runs)]
+
+def distribution_stats(values, percentiles=(5, 25, 50, 75, 95)):
+    """
+    Return a dictionary with the mean, standard deviation, minimum,
+    maximum and the given percentiles (nearest rank) of values.
+    """
+    ordered = sorted(values)
+    count = len(ordered)
+    mean = sum(ordered) / count
+    variance = sum([(value - mean) ** 2 for value in ordered]) / count
+    stats = {"mean": mean, "stdev": math.sqrt(variance),
+             "min": ordered[0], "max": ordered[-1]}
+    for percent in percentiles:
+        rank = int(math.ceil(percent / 100.0 * count)) - 1
+        stats["p" + str(percent)] = ordered[min(max(rank, 0), count - 1)]
+    return stats
+
+# Strategies available to sweep() by name
+STRATEGIES = {"Cursor": strategy_cursor,
+              "Cheap": strategy_cheap,
+              "Expensive": strategy_expensive,
+              "Best": strategy_best}
+
+def history_timeline(history, build_info):
+    """
+    Rebuild the state right after every purchase of a history list.
+
+    Returns a list of tuples (time, total cookies, current cookies, cps),
+    one per history entry.  Item cps values are read from build_info,
+    which update_item never changes.
+    """
+    timeline = []
+    cps = 1.0
+    spent = 0.0
+    for entry_time, item, cost, total in history:
+        if item != None:
+            cps += build_info.get_cps(item)
+            spent += cost
+        timeline.append((entry_time, total, total - spent, cps))
+    return timeline
+
+def time_to_total(state, build_info, thresholds):
+    """
+    Return, for each threshold, the first time at which the total
+    cookies of a finished game reached it, or None if it never did.
+    The game must have been run with its full history.
+    """
+    timeline = history_timeline(state.iter_history(), build_info)
+    end_time = state.get_time()
+    result = []
+    for threshold in thresholds:
+        reached = None
+        for index in range(len(timeline)):
+            entry_time, total, dummy_cookies, cps = timeline[index]
+            if index + 1 < len(timeline):
+                next_time = timeline[index + 1][0]
+            else:
+                next_time = end_time
+            if total >= threshold:
+                reached = entry_time
+                break
+            if total + cps * (next_time - entry_time) >= threshold:
+                reached = entry_time + (threshold - total) / cps
+                break
+        result.append(reached)
+    return result
+
+def simulate_checkpoints(build_info, strategy, times):
+    """
+    Run one game for the last of the sorted checkpoint times and
+    report the state at every checkpoint.
+
+    Returns a list of tuples (time, total cookies, current cookies,
+    cps), one per checkpoint.  Between purchases the state is
+    interpolated from the history; a purchase made exactly at a
+    checkpoint is counted.  All values come from this single run, so
+    a strategy that looks at time_left may act differently than in
+    separate shorter runs.
+    """
+    if not times:
+        return []
+    state = simulate_clicker(build_info, times[-1], strategy)
+    timeline = history_timeline(state.iter_history(), build_info)
+    result = []
+    index = 0
+    for checkpoint in times:
+        while index + 1 < len(timeline) and timeline[index + 1][0] <= checkpoint:
+            index += 1
+        entry_time, total, cookies, cps = timeline[index]
+        elapsed = checkpoint - entry_time
+        result.append((checkpoint, total + cps * elapsed, cookies + cps * elapsed, cps))
+    return result
+
+def _sweep_task(task):
+    """
+    Pool worker: run one simulation on a fresh BuildInfo.
+    """
+    strategy_name, config_name, info, growth, duration, thresholds, seed = task
+    random.seed(seed)
+    build_info = IndexedBuildInfo(provided.BuildInfo(info, growth))
+    state = simulate_clicker(build_info, duration, STRATEGIES[strategy_name])
+    return (strategy_name, config_name, duration, state.get_total_cookies(),
+            time_to_total(state, build_info, thresholds))
+
+def sweep(durations, configs, thresholds=(), strategy_names=None, processes=None):
+    """
+    Simulate every strategy for every duration and every build info
+    configuration, spread over a process pool.
+
+    configs maps a configuration name to a tuple (build info dictionary,
+    growth factor).  Every simulation gets its own BuildInfo, since
+    simulate_clicker changes it.  Prints a table of final total cookies
+    and times to reach each threshold, and the throughput.
+
+    Returns a list of tuples (strategy, config, duration, total cookies,
+    times to thresholds).
+    """
+    if strategy_names == None:
+        strategy_names = sorted(STRATEGIES.keys())
+    tasks = []
+    for strategy_name in strategy_names:
+        for config_name in sorted(configs.keys()):
+            info, growth = configs[config_name]
+            for duration in durations:
+                tasks.append((strategy_name, config_name, info, growth,
+                              duration, tuple(thresholds), len(tasks)))
+
+    start = time.time()
+    if processes == 1:
+        rows = map(_sweep_task, tasks)
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            rows = pool.map(_sweep_task, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - start
+
+    header = "%-10s %-10s %12s %14s" % ("strategy", "config", "duration", "total")
+    for threshold in thresholds:
+        header += " %12s" % ("t>=%g" % threshold)
+    print header
+    for strategy_name, config_name, duration, total, reached in rows:
+        line = "%-10s %-10s %12g %14.6g" % (strategy_name, config_name, duration, total)
+        for reached_time in reached:
+            if reached_time == None:
+                line += " %12s" % "-"
+            else:
+                line += " %12.1f" % reached_time
+        print line
+    print len(rows), "simulations in", round(elapsed, 2), "seconds,", round(len(rows) / elapsed, 1), "simulations/sec"
+    return rows
+
+def benchmark_cost_index(num_items=500, num_decisions=20000):
+    """
+    Time strategy_cheap and strategy_expensive on synthetic build info
+    with num_items items, scanning a plain BuildInfo against using an
+    IndexedBuildInfo.  Every decision buys the chosen item.  Returns
+    a dictionary of decisions per second.
+    """
+    rng = random.Random(12)
+    info = {}
+    for index in range(num_items):
+        info["Item " + str(index)] = [rng.uniform(10.0, 1e6), rng.uniform(0.1, 100.0)]
+    rates = {}
+    for name, strategy in (("cheap", strategy_cheap), ("expensive", strategy_expensive)):
+        for label, build_info in (("scan", provided.BuildInfo(info, 1.15)),
+                                  ("index", IndexedBuildInfo(provided.BuildInfo(info, 1.15)))):
+            start = time.time()
+            for dummy_i in range(num_decisions):
+                item = strategy(0.0, 1000.0, 1000.0, build_info)
+                if item != None:
+                    build_info.update_item(item)
+            rates[name + " " + label] = num_decisions / (time.time() - start)
+            print "%s (%s): %d decisions/sec" % (name, label, rates[name + " " + label])
+    return rates
+
+def benchmark_bulk(repeats=5):
+    """
+    Time simulate_clicker with and without bulk runs: strategy_cursor
+    and strategy_cheap on the default build info at SIM_TIME, where
+    most purchases need a wait, and strategy_cheap on a cheap, high
+    cps Cursor with low growth, where many copies are affordable at
+    once.  Returns a dictionary of (plain, bulk) best times.
+    """
+    fast_cursor = {"Cursor": [1.0, 1.0], "Grandma": [1e6, 1.0]}
+    cases = (("cursor", None, 1.15, SIM_TIME, strategy_cursor),
+             ("cheap", None, 1.15, SIM_TIME, strategy_cheap),
+             ("cheap, fast cursor", fast_cursor, 1.001, 200.0, strategy_cheap))
+    times = {}
+    for name, info, growth, duration, strategy in cases:
+        best = []
+        for bulk in (False, True):
+            elapsed = []
+            for dummy_i in range(repeats):
+                start = time.time()
+                simulate_clicker(provided.BuildInfo(info, growth), duration, strategy, bulk)
+                elapsed.append(time.time() - start)
+            best.append(min(elapsed))
+        times[name] = tuple(best)
+        print "%s: plain %.2fms, bulk %.2fms (%.1fx)" % (
+            name, best[0] * 1000, best[1] * 1000, best[0] / best[1])
+    return times
+
 def run_strategy(strategy_name, time, strategy):
     """
     Run a simulation with one strategy
@@ -233,5 +998,6 @@ def run():
     run_strategy("Expensive", SIM_TIME, strategy_expensive)
     run_strategy("Best", SIM_TIME, strategy_best)
     
-run()
+if __name__ == "__main__":
+    run()
     
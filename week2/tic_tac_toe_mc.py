@@ -2,7 +2,9 @@
 Monte Carlo Tic-Tac-Toe Player
 """
 
+import math
 import random
+import time
 import poc_ttt_gui
 import poc_ttt_provided as provided
 
@@ -39,20 +41,53 @@ def mc_trial(board, player):
     alternating between players. The function 
     should return when the game is over. 
     The modified board will contain the 
-    state of the game, so the function does 
-    not return anything.
+    state of the game.  Returns the list of
+    (row, col) squares played; for a BitBoard
+    they come in square order, not move order.
+
+    Keeps a count of each player's pieces on
+    every line, so a finished game is spotted
+    from the lines through the last move
+    instead of calling check_win every ply.
     """
+    if isinstance(board, BitBoard):
+        xmask, omask = board.get_masks()
+        board.play_out(player)
+        new_xmask, new_omask = board.get_masks()
+        return board.mask_squares((new_xmask ^ xmask) | (new_omask ^ omask))
+    dim = board.get_dim()
+    through = board_lines(dim)[1]
+    counts = {provided.PLAYERX: {}, provided.PLAYERO: {}}
+    empty_squares = []
+    for row in range(dim):
+        for col in range(dim):
+            owner = board.square(row, col)
+            if owner == provided.EMPTY:
+                empty_squares.append((row, col))
+            else:
+                for mask in through[row * dim + col]:
+                    counts[owner][mask] = counts[owner].get(mask, 0) + 1
+    moves = []
     cur_player = player
-    winner = None
-    while winner == None:
-        empty_squares = board.get_empty_squares()
+    while empty_squares:
         pos = random.randrange(len(empty_squares))
         row, col = empty_squares[pos]
+        empty_squares[pos] = empty_squares[-1]
+        empty_squares.pop()
         board.move(row, col, cur_player)
-        winner = board.check_win()
+        moves.append((row, col))
+        taken = counts[cur_player]
+        full_line = False
+        for mask in through[row * dim + col]:
+            taken[mask] = taken.get(mask, 0) + 1
+            if taken[mask] == dim:
+                full_line = True
+        if full_line:
+            break
         cur_player = provided.switch_player(cur_player)
+    return moves
 
-def mc_update_scores(scores, board, player):
+def mc_update_scores(scores, board, player, moves = None):
     """
     This function takes a grid of scores 
     (a list of lists) with the same dimensions 
@@ -62,25 +97,35 @@ def mc_update_scores(scores, board, player):
     completed board and update the scores grid. 
     As the function updates the scores grid 
     directly, it does not return anything. 
+
+    When moves is the list returned by
+    mc_trial, only those squares are scored.
     """
+    if isinstance(board, BitBoard):
+        played = None
+        if moves is not None:
+            played = 0
+            dim = board.get_dim()
+            for row, col in moves:
+                played |= 1 << (row * dim + col)
+        bit_update_scores(scores, board, player, board.check_win(), played)
+        return scores
     game_res = board.check_win()
     if game_res == provided.DRAW:
         return
-    dim = board.get_dim()
+    if moves is None:
+        dim = board.get_dim()
+        moves = [(row, col) for row in range(dim) for col in range(dim)]
     if game_res == player:
-        for row in range(dim):
-            for col in range(dim):
-                if board.square(row, col) == player: 
-                    scores[row][col] += MCMATCH
-                elif board.square(row, col) == provided.switch_player(player):
-                    scores[row][col] += -MCOTHER 
+        match, other = MCMATCH, -MCOTHER
     else:
-        for row in range(dim):
-            for col in range(dim):
-                if board.square(row, col) == player: 
-                    scores[row][col] += -MCMATCH
-                elif board.square(row, col) == provided.switch_player(player):
-                    scores[row][col] += MCOTHER 
+        match, other = -MCMATCH, MCOTHER
+    opponent = provided.switch_player(player)
+    for row, col in moves:
+        if board.square(row, col) == player: 
+            scores[row][col] += match
+        elif board.square(row, col) == opponent:
+            scores[row][col] += other
     return scores
 
 def get_best_move(board, scores):
@@ -115,17 +160,700 @@ def mc_move(board, player, trials):
     """
     dim = board.get_dim()
     score_grid = [[0 for dummy_j in range(dim)] for dummy_k in range(dim)]
+    bit_board = BitBoard.from_board(board)
     for dummy_i in range(trials):
-        board_cp = board.clone()
-        mc_trial(board_cp, player)
-        mc_update_scores(score_grid, board_cp, player)
+        board_cp = bit_board.clone()
+        winner = board_cp.play_out(player)
+        bit_update_scores(score_grid, board_cp, player, winner)
     row, col = get_best_move(board, score_grid)
     return row, col
 
+##################################################################
+# Bitboard representation for fast rollouts
+
+# dim -> (winning line masks, masks of the lines through each square)
+_LINES = {}
+
+def board_lines(dim):
+    """
+    Return a tuple (line masks, lines through each square) for boards
+    of the given dimension.  Square (row, col) is bit row * dim + col.
+    """
+    if dim not in _LINES:
+        lines = []
+        for row in range(dim):
+            lines.append([row * dim + col for col in range(dim)])
+        for col in range(dim):
+            lines.append([row * dim + col for row in range(dim)])
+        lines.append([idx * dim + idx for idx in range(dim)])
+        lines.append([idx * dim + dim - 1 - idx for idx in range(dim)])
+        masks = []
+        through = [[] for dummy_idx in range(dim * dim)]
+        for line in lines:
+            mask = 0
+            for idx in line:
+                mask |= 1 << idx
+            masks.append(mask)
+            for idx in line:
+                through[idx].append(mask)
+        _LINES[dim] = (masks, through)
+    return _LINES[dim]
+
+class BitBoard:
+    """
+    Tic-Tac-Toe board stored as one bitmask of taken squares per
+    player.  Implements the TTTBoard methods the Monte Carlo functions
+    use, so it can stand in for the provided board.
+    """
+
+    def __init__(self, dim, reverse = False, xmask = 0, omask = 0):
+        self._dim = dim
+        self._reverse = reverse
+        self._xmask = xmask
+        self._omask = omask
+
+    @staticmethod
+    def from_board(board):
+        """
+        Build a BitBoard from a provided TTTBoard
+        """
+        dim = board.get_dim()
+        xmask = 0
+        omask = 0
+        for row in range(dim):
+            for col in range(dim):
+                square = board.square(row, col)
+                if square == provided.PLAYERX:
+                    xmask |= 1 << (row * dim + col)
+                elif square == provided.PLAYERO:
+                    omask |= 1 << (row * dim + col)
+        return BitBoard(dim, getattr(board, "_reverse", False), xmask, omask)
+
+    def to_board(self):
+        """
+        Return an equivalent provided TTTBoard
+        """
+        dim = self._dim
+        grid = [[self.square(row, col) for col in range(dim)] for row in range(dim)]
+        return provided.TTTBoard(dim, self._reverse, grid)
+
+    def __str__(self):
+        return str(self.to_board())
+
+    def get_dim(self):
+        """
+        Return the dimension of the board
+        """
+        return self._dim
+
+    def get_masks(self):
+        """
+        Return the (PLAYERX, PLAYERO) bitmasks
+        """
+        return self._xmask, self._omask
+
+    def square(self, row, col):
+        """
+        Return the status (EMPTY, PLAYERX, PLAYERO) of the square at
+        position (row, col)
+        """
+        bit = 1 << (row * self._dim + col)
+        if self._xmask & bit:
+            return provided.PLAYERX
+        if self._omask & bit:
+            return provided.PLAYERO
+        return provided.EMPTY
+
+    def empty_indices(self):
+        """
+        Return the bit indices of all empty squares
+        """
+        taken = self._xmask | self._omask
+        return [idx for idx in range(self._dim * self._dim) if not (taken >> idx) & 1]
+
+    def mask_squares(self, mask):
+        """
+        Return a list of (row, col) tuples for the squares set in mask
+        """
+        dim = self._dim
+        squares = []
+        while mask:
+            low = mask & -mask
+            idx = low.bit_length() - 1
+            squares.append((idx // dim, idx % dim))
+            mask ^= low
+        return squares
+
+    def get_empty_squares(self):
+        """
+        Return a list of (row, col) tuples for all empty squares
+        """
+        dim = self._dim
+        return [(idx // dim, idx % dim) for idx in self.empty_indices()]
+
+    def move(self, row, col, player):
+        """
+        Place player on the board at position (row, col), if empty
+        """
+        bit = 1 << (row * self._dim + col)
+        if (self._xmask | self._omask) & bit:
+            return
+        if player == provided.PLAYERX:
+            self._xmask |= bit
+        else:
+            self._omask |= bit
+
+    def check_win(self):
+        """
+        Return PLAYERX, PLAYERO or DRAW if the game is over, or None
+        if it is still in progress
+        """
+        winner = None
+        for mask in board_lines(self._dim)[0]:
+            if self._xmask & mask == mask:
+                winner = provided.PLAYERX
+                break
+            if self._omask & mask == mask:
+                winner = provided.PLAYERO
+                break
+        if winner != None:
+            if self._reverse:
+                return provided.switch_player(winner)
+            return winner
+        if self._xmask | self._omask == (1 << (self._dim * self._dim)) - 1:
+            return provided.DRAW
+        return None
+
+    def check_reverse(self):
+        """
+        Return True if this is a reverse game (lines lose)
+        """
+        return self._reverse
+
+    def clone(self):
+        """
+        Return a copy of the board
+        """
+        return BitBoard(self._dim, self._reverse, self._xmask, self._omask)
+
+    def play_out(self, player, rng = random):
+        """
+        Play random moves, starting with player, until the game is
+        over.  Only the lines through each new stone are checked.
+        Returns the result of the game as check_win would.
+        """
+        through = board_lines(self._dim)[1]
+        empties = self.empty_indices()
+        masks = [self._xmask, self._omask]
+        cur = 0 if player == provided.PLAYERX else 1
+        winner = None
+        while empties:
+            pos = int(rng.random() * len(empties))
+            idx = empties[pos]
+            empties[pos] = empties[-1]
+            empties.pop()
+            mine = masks[cur] | (1 << idx)
+            masks[cur] = mine
+            for line in through[idx]:
+                if mine & line == line:
+                    winner = provided.PLAYERX if cur == 0 else provided.PLAYERO
+                    break
+            if winner != None:
+                break
+            cur = 1 - cur
+        self._xmask, self._omask = masks
+        if winner == None:
+            return provided.DRAW
+        if self._reverse:
+            return provided.switch_player(winner)
+        return winner
+
+def bit_update_scores(scores, board, player, winner, played = None):
+    """
+    mc_update_scores for a finished BitBoard whose result is known.
+    Scores every stone on the board, including those placed before
+    the trial, or only the squares set in the played mask if given.
+    """
+    if winner == provided.DRAW:
+        return
+    dim = board.get_dim()
+    xmask, omask = board.get_masks()
+    if played is not None:
+        xmask &= played
+        omask &= played
+    if player == provided.PLAYERX:
+        mine, other = xmask, omask
+    else:
+        mine, other = omask, xmask
+    if winner == player:
+        mine_score, other_score = MCMATCH, -MCOTHER
+    else:
+        mine_score, other_score = -MCMATCH, MCOTHER
+    for mask, value in ((mine, mine_score), (other, other_score)):
+        while mask:
+            low = mask & -mask
+            idx = low.bit_length() - 1
+            scores[idx // dim][idx % dim] += value
+            mask ^= low
+
+##################################################################
+# Deadline-driven Monte Carlo
+
+def mc_move_timed(board, player, time_budget, confidence = 0.99,
+                  min_trials = 50, check_every = 10):
+    """
+    Anytime version of mc_move: run trials with mc_trial and
+    mc_update_scores until time_budget seconds have passed, or stop
+    earlier once the leading move is ahead of the runner-up with the
+    given confidence.  The test treats each square's per-trial score
+    as a sample and compares the two best means with a normal
+    approximation, checked every check_every trials after min_trials.
+
+    Returns a tuple ((row, col), diagnostics) where diagnostics is a
+    dictionary with the trials run, the elapsed seconds, the score
+    margin per trial between the two best moves, the confidence that
+    the leader is better and whether the deadline was hit.
+    """
+    start = time.time()
+    deadline = start + time_budget
+    dim = board.get_dim()
+    bit_board = BitBoard.from_board(board)
+    candidates = board.get_empty_squares()
+    score_grid = [[0 for dummy_j in range(dim)] for dummy_k in range(dim)]
+    squares = [[0 for dummy_j in range(dim)] for dummy_k in range(dim)]
+    trials = 0
+    margin = 0.0
+    certainty = 1.0 if len(candidates) < 2 else 0.0
+    timed_out = False
+    while len(candidates) > 1:
+        for dummy_i in range(check_every):
+            board_cp = bit_board.clone()
+            mc_trial(board_cp, player)
+            trial_scores = [[0 for dummy_j in range(dim)] for dummy_k in range(dim)]
+            mc_update_scores(trial_scores, board_cp, player)
+            for row, col in candidates:
+                value = trial_scores[row][col]
+                score_grid[row][col] += value
+                squares[row][col] += value * value
+            trials += 1
+        means = []
+        for row, col in candidates:
+            mean = float(score_grid[row][col]) / trials
+            variance = max(float(squares[row][col]) / trials - mean * mean, 0.0)
+            means.append((mean, variance))
+        means.sort(reverse = True)
+        margin = means[0][0] - means[1][0]
+        spread = math.sqrt((means[0][1] + means[1][1]) / trials)
+        if spread > 0.0:
+            certainty = 0.5 * (1.0 + math.erf(margin / spread / math.sqrt(2.0)))
+        elif margin > 0.0:
+            certainty = 1.0
+        else:
+            certainty = 0.5
+        if trials >= min_trials and certainty >= confidence:
+            break
+        if time.time() >= deadline:
+            timed_out = True
+            break
+    diagnostics = {"trials": trials,
+                   "elapsed": time.time() - start,
+                   "margin": margin,
+                   "confidence": certainty,
+                   "deadline_hit": timed_out}
+    return get_best_move(board, score_grid), diagnostics
+
+##################################################################
+# Batched rollouts
+
+def _counter_add(planes, mask):
+    """
+    Add 1 to the count of every square set in mask.  The counts are
+    kept bit-sliced: planes[i] holds bit i of every square's count.
+    """
+    index = 0
+    while mask:
+        if index == len(planes):
+            planes.append(0)
+        plane = planes[index]
+        planes[index] = plane ^ mask
+        mask &= plane
+        index += 1
+
+def _counter_value(planes, idx):
+    """
+    Return the count of square idx from bit-sliced planes.
+    """
+    count = 0
+    for bit in range(len(planes)):
+        count |= ((planes[bit] >> idx) & 1) << bit
+    return count
+
+def batch_scores(board, player, trials, rng = random):
+    """
+    Play trials random games from board and return the score grid
+    that mc_update_scores would build over them.
+
+    Each game is a random permutation of the empty squares.  Both
+    players' stones for a full board are built from alternate slices
+    of it, and the lines one player fully owns are found with the line
+    masks.  The game ends where the earliest such line is completed,
+    and its prefix is added to bit-sliced counters, one per
+    (outcome, owner) pair.
+    """
+    bit_board = BitBoard.from_board(board)
+    dim = bit_board.get_dim()
+    masks, dummy_through = board_lines(dim)
+    line_squares = []
+    for mask in masks:
+        line_squares.append([idx for idx in range(dim * dim) if (mask >> idx) & 1])
+    xmask, omask = bit_board.get_masks()
+    if player == provided.PLAYERX:
+        mine0, other0 = xmask, omask
+    else:
+        mine0, other0 = omask, xmask
+    bits = [1 << idx for idx in range(dim * dim)]
+    empties = bit_board.empty_indices()
+    position = [-1] * (dim * dim)
+    # counters for squares of: mine in wins, other in wins, mine in losses, other in losses
+    counters = [[], [], [], []]
+    for dummy_i in range(trials):
+        order = list(empties)
+        rng.shuffle(order)
+        mine_full = mine0 | sum(map(bits.__getitem__, order[0::2]))
+        other_full = other0 | sum(map(bits.__getitem__, order[1::2]))
+        for ply in range(len(order)):
+            position[order[ply]] = ply
+        end = None
+        for line in range(len(masks)):
+            mask = masks[line]
+            if mine_full & mask == mask or other_full & mask == mask:
+                done = max(map(position.__getitem__, line_squares[line]))
+                if end == None or done < end:
+                    end = done
+        for idx in empties:
+            position[idx] = -1
+        if end == None:
+            continue
+        played = order[:end + 1]
+        mine = mine0 | sum(map(bits.__getitem__, played[0::2]))
+        other = other0 | sum(map(bits.__getitem__, played[1::2]))
+        mover_won = end % 2 == 0
+        if bit_board.check_reverse():
+            mover_won = not mover_won
+        if mover_won:
+            _counter_add(counters[0], mine)
+            _counter_add(counters[1], other)
+        else:
+            _counter_add(counters[2], mine)
+            _counter_add(counters[3], other)
+    scores = [[0 for dummy_j in range(dim)] for dummy_k in range(dim)]
+    for idx in range(dim * dim):
+        scores[idx // dim][idx % dim] = (
+            MCMATCH * (_counter_value(counters[0], idx) - _counter_value(counters[2], idx)) +
+            MCOTHER * (_counter_value(counters[3], idx) - _counter_value(counters[1], idx)))
+    return scores
+
+def mc_move_batch(board, player, trials):
+    """
+    Same as mc_move, with the trials played by batch_scores.
+    """
+    return get_best_move(board, batch_scores(board, player, trials))
+
+##################################################################
+# UCT Monte Carlo Tree Search
+
+class UCTNode:
+    """
+    Search tree node for the position 'board', with 'to_move' the
+    player to play next.  'wins' counts results from the point of view
+    of the player who made the move leading here (draws count 0.5).
+
+    Besides its children, a node keeps all-moves-as-first statistics
+    for each of its legal moves: how the player to move fared in every
+    simulation through this node in which they took that square at
+    any later point.  They give moves useful values long before their
+    own subtrees have been visited much.
+    """
+
+    def __init__(self, board, to_move):
+        self.board = board
+        self.to_move = to_move
+        self.result = board.check_win()
+        self.children = {}
+        self.moves = []
+        if self.result == None:
+            self.moves = board.empty_indices()
+        self.visits = 0
+        self.wins = 0.0
+        self.amaf_visits = {}
+        self.amaf_wins = {}
+
+    def value(self, idx, exploration, log_visits, equivalence):
+        """
+        Selection value of move idx: the child's win rate blended with
+        the move's all-moves-as-first rate, plus the UCB1 bonus
+        """
+        amaf_visits = self.amaf_visits.get(idx, 0)
+        amaf_rate = 0.5
+        if amaf_visits:
+            amaf_rate = self.amaf_wins[idx] / amaf_visits
+        child = self.children.get(idx)
+        if child == None or not child.visits:
+            return amaf_rate + exploration * math.sqrt(log_visits)
+        beta = math.sqrt(equivalence / (3.0 * child.visits + equivalence))
+        rate = (1.0 - beta) * child.wins / child.visits + beta * amaf_rate
+        return rate + exploration * math.sqrt(log_visits / child.visits)
+
+    def select(self, exploration, equivalence):
+        """
+        Return the legal move with the best selection value
+        """
+        log_visits = math.log(self.visits + 1)
+        best = None
+        best_value = None
+        for idx in self.moves:
+            value = self.value(idx, exploration, log_visits, equivalence)
+            if best == None or value > best_value:
+                best = idx
+                best_value = value
+        return best
+
+    def child(self, idx):
+        """
+        Return the child reached by move idx, creating it if needed
+        """
+        node = self.children.get(idx)
+        if node == None:
+            dim = self.board.get_dim()
+            board = self.board.clone()
+            board.move(idx // dim, idx % dim, self.to_move)
+            node = UCTNode(board, provided.switch_player(self.to_move))
+            self.children[idx] = node
+        return node
+
+    def find(self, board, to_move, depth):
+        """
+        Return the node for the given BitBoard and player to move
+        within depth plies below this one, or None.  Boards of another
+        size or game type never match.
+        """
+        if (self.board.get_dim() != board.get_dim() or
+                self.board.check_reverse() != board.check_reverse()):
+            return None
+        if self.to_move == to_move and self.board.get_masks() == board.get_masks():
+            return self
+        if depth == 0:
+            return None
+        for child in self.children.values():
+            node = child.find(board, to_move, depth - 1)
+            if node != None:
+                return node
+        return None
+
+class MCTSPlayer:
+    """
+    UCT Monte Carlo Tree Search player with the same (board, player,
+    trials) call signature as mc_move.  Each trial walks down the tree
+    by UCB1, adds one node, plays a random game from it and backs the
+    result up, along with all-moves-as-first statistics (UCT-RAVE).
+
+    The tree is kept between calls: when the new position is our
+    previous move plus the opponent's reply, the matching subtree
+    becomes the new root and its statistics are reused.  After each
+    call, visits maps every candidate (row, col) to its number of
+    visits and reused is the number of root visits carried over.
+    """
+
+    def __init__(self, exploration = 0.5, equivalence = 300.0, rng = random):
+        self._exploration = exploration
+        self._equivalence = equivalence
+        self._rng = rng
+        self._root = None
+        self.visits = {}
+        self.reused = 0
+
+    def __call__(self, board, player, trials):
+        """
+        Run trials iterations from board and return the most visited
+        move as a (row, column) tuple
+        """
+        bit_board = BitBoard.from_board(board)
+        root = None
+        if self._root != None:
+            root = self._root.find(bit_board, player, 2)
+        if root == None:
+            root = UCTNode(bit_board, player)
+        self.reused = root.visits
+        self._root = root
+        for dummy_i in range(trials):
+            self._iterate(root)
+
+        dim = bit_board.get_dim()
+        self.visits = {}
+        best = None
+        best_key = None
+        log_visits = math.log(root.visits + 1)
+        for idx in root.moves:
+            child = root.children.get(idx)
+            visits = 0
+            if child != None:
+                visits = child.visits
+            self.visits[(idx // dim, idx % dim)] = visits
+            key = (visits, root.value(idx, 0.0, log_visits, self._equivalence))
+            if best == None or key > best_key:
+                best = idx
+                best_key = key
+        return best // dim, best % dim
+
+    def _iterate(self, root):
+        """
+        Run one selection, expansion, rollout and backup pass
+        """
+        node = root
+        path = [node]
+        while node.result == None:
+            idx = node.select(self._exploration, self._equivalence)
+            expanded = idx not in node.children
+            node = node.child(idx)
+            path.append(node)
+            if expanded:
+                break
+        result = node.result
+        final = node.board
+        if result == None:
+            final = node.board.clone()
+            result = final.play_out(node.to_move, self._rng)
+        xmask, omask = final.get_masks()
+        for visited in path:
+            visited.visits += 1
+            if result == provided.DRAW:
+                visited.wins += 0.5
+            elif result != visited.to_move:
+                visited.wins += 1.0
+            if visited.result != None:
+                continue
+            if visited.to_move == provided.PLAYERX:
+                played = xmask
+            else:
+                played = omask
+            taken = visited.board.get_masks()
+            played &= ~(taken[0] | taken[1])
+            if result == provided.DRAW:
+                reward = 0.5
+            elif result == visited.to_move:
+                reward = 1.0
+            else:
+                reward = 0.0
+            while played:
+                low = played & -played
+                idx = low.bit_length() - 1
+                visited.amaf_visits[idx] = visited.amaf_visits.get(idx, 0) + 1
+                visited.amaf_wins[idx] = visited.amaf_wins.get(idx, 0.0) + reward
+                played ^= low
+
+_MCTS_PLAYER = MCTSPlayer()
+
+def mcts_move(board, player, trials):
+    """
+    Play a move with a shared MCTSPlayer, so the search tree carries
+    over between consecutive calls of a game.
+    """
+    return _MCTS_PLAYER(board, player, trials)
+
+##################################################################
+# Parallel trials
+
+def _trial_chunk(task):
+    """
+    Pool worker: run a share of the trials with a private generator
+    and return the local score grid.
+    """
+    dim, reverse, xmask, omask, player, trials, seed = task
+    rng = random.Random(seed)
+    board = BitBoard(dim, reverse, xmask, omask)
+    scores = [[0 for dummy_j in range(dim)] for dummy_k in range(dim)]
+    for dummy_i in range(trials):
+        board_cp = board.clone()
+        winner = board_cp.play_out(player, rng)
+        bit_update_scores(scores, board_cp, player, winner)
+    return scores
+
+def mc_move_parallel(board, player, trials, workers = None, seed = None, pool = None):
+    """
+    Same as mc_move, but the trials are split across worker
+    processes.  Worker i runs its share with its own generator seeded
+    from (seed, i) and fills a local score grid.  The grids are summed
+    in worker order, so a given seed and worker count always gives the
+    same move.
+
+    Pass a multiprocessing.Pool as pool to reuse it from move to move;
+    it is left open.  Without one, a pool is started and closed for
+    this move only.
+    """
+    import multiprocessing
+    if workers == None:
+        workers = multiprocessing.cpu_count()
+    if seed == None:
+        seed = random.randrange(1 << 30)
+    bit_board = BitBoard.from_board(board)
+    dim = bit_board.get_dim()
+    xmask, omask = bit_board.get_masks()
+    tasks = []
+    for index in range(workers):
+        share = trials // workers + (1 if index < trials % workers else 0)
+        tasks.append((dim, bit_board.check_reverse(), xmask, omask,
+                      player, share, seed * 1000003 + index))
+    if pool != None:
+        grids = pool.map(_trial_chunk, tasks)
+    elif workers == 1:
+        grids = map(_trial_chunk, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            grids = pool.map(_trial_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    score_grid = [[0 for dummy_j in range(dim)] for dummy_k in range(dim)]
+    for grid in grids:
+        for row in range(dim):
+            for col in range(dim):
+                score_grid[row][col] += grid[row][col]
+    return get_best_move(board, score_grid)
+
+def benchmark_trials(dims = (3, 4, 5, 6, 7), trials = 2000):
+    """
+    Compare Monte Carlo trials per second on the provided board and
+    on BitBoard for each board dimension.  Returns a list of
+    (dim, provided_rate, bitboard_rate) tuples.
+    """
+    results = []
+    for dim in dims:
+        board = provided.TTTBoard(dim)
+        scores = [[0 for dummy_j in range(dim)] for dummy_k in range(dim)]
+        start = time.time()
+        for dummy_i in range(trials):
+            board_cp = board.clone()
+            moves = mc_trial(board_cp, provided.PLAYERX)
+            mc_update_scores(scores, board_cp, provided.PLAYERX, moves)
+        slow = trials / (time.time() - start)
+        bit_board = BitBoard.from_board(board)
+        start = time.time()
+        for dummy_i in range(trials):
+            board_cp = bit_board.clone()
+            mc_trial(board_cp, provided.PLAYERX)
+            mc_update_scores(scores, board_cp, provided.PLAYERX)
+        fast = trials / (time.time() - start)
+        print "dim %d: provided board %d trials/sec, BitBoard %d trials/sec (%.1fx)" % (
+            dim, slow, fast, fast / slow)
+        results.append((dim, slow, fast))
+    return results
+
 # Test game with the console or the GUI.
 # Uncomment whichever you prefer.
 # Both should be commented out when you submit for
 # testing to save time.
 
-provided.play_game(mc_move, NTRIALS, False)        
-# poc_ttt_gui.run_gui(3, provided.PLAYERX, mc_move, NTRIALS, False)
\ No newline at end of file
+if __name__ == "__main__":
+    provided.play_game(mc_move, NTRIALS, False)
+    # poc_ttt_gui.run_gui(3, provided.PLAYERX, mc_move, NTRIALS, False)
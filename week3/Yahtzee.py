@@ -5,6 +5,11 @@ Simplifications:  only allow discard and roll, only score against upper level
 
 # Used to increase the timeout, if necessary
 import codeskulptor
+import array
+import os
+import random
+import sys
+import time
 codeskulptor.set_timeout(20)
 
 def list_powerset(lst):
@@ -38,6 +43,61 @@ def gen_all_sequences(outcomes, length):
         answer_set = temp_set
     return answer_set
 
+def gen_sorted_sequences(outcomes, length):
+    """
+    Iterative generator over the sorted sequences of outcomes of given
+    length, so each multiset of outcomes comes up exactly once.
+    outcomes must be sorted.
+    """
+    num = len(outcomes)
+    if num == 0 and length > 0:
+        return
+    indices = [0] * length
+    while True:
+        yield tuple([outcomes[idx] for idx in indices])
+        pos = length - 1
+        while pos >= 0 and indices[pos] == num - 1:
+            pos -= 1
+        if pos < 0:
+            return
+        value = indices[pos] + 1
+        for fill in range(pos, length):
+            indices[fill] = value
+
+
+_FACTORIALS = [1]
+
+def factorial(num):
+    """
+    Return num!, remembering the values computed so far.
+    """
+    while len(_FACTORIALS) <= num:
+        _FACTORIALS.append(_FACTORIALS[-1] * len(_FACTORIALS))
+    return _FACTORIALS[num]
+
+
+def multinomial_weight(sequence):
+    """
+    Number of distinct orderings of the sorted sequence.
+    """
+    weight = factorial(len(sequence))
+    run = 1
+    for idx in range(1, len(sequence)):
+        if sequence[idx] == sequence[idx - 1]:
+            run += 1
+        else:
+            weight //= factorial(run)
+            run = 1
+    return weight // factorial(run)
+
+
+def multiset_count(num_die_sides, num_free_dice):
+    """
+    Number of sorted outcomes when rolling num_free_dice dice.
+    """
+    return factorial(num_die_sides + num_free_dice - 1) // (
+        factorial(num_free_dice) * factorial(num_die_sides - 1))
+
 
 def score(hand):
     """
@@ -55,7 +115,67 @@ def score(hand):
     return max(score_boxes)
 
 
-def expected_value(held_dice, num_die_sides, num_free_dice):
+def score_batch(hands):
+    """
+    Compute score for every hand in a list of hands at once.  Builds
+    one column of face totals per face across all hands, then takes
+    the best column for each hand.
+
+    Returns a list of integer scores, in the order of hands
+    """
+    if not hands:
+        return []
+    hands = [list(hand) for hand in hands]
+    top = max([max(hand) for hand in hands])
+    score_boxes = [[0] * len(hands)]
+    for face in range(1, top + 1):
+        score_boxes.append([hand.count(face) * face for hand in hands])
+    return map(max, *score_boxes)
+
+
+_OUTCOME_TABLES = {}
+
+def outcome_table(num_die_sides, num_free_dice):
+    """
+    Sorted outcomes of rolling num_free_dice dice, built once per
+    (sides, free dice) and kept.  Returns a tuple (count columns,
+    weights): column face - 1 holds how many dice show that face in
+    each outcome, and weights holds how many rolls give each outcome.
+    """
+    key = (num_die_sides, num_free_dice)
+    if key not in _OUTCOME_TABLES:
+        die_outcomes = [index + 1 for index in range(num_die_sides)]
+        columns = [array.array("B") for dummy_face in die_outcomes]
+        weights = []
+        for item in gen_sorted_sequences(die_outcomes, num_free_dice):
+            for face in die_outcomes:
+                columns[face - 1].append(item.count(face))
+            weights.append(multinomial_weight(item))
+        _OUTCOME_TABLES[key] = (columns, weights)
+    return _OUTCOME_TABLES[key]
+
+
+def expected_value_batch(held_dice, num_die_sides, num_free_dice):
+    """
+    Compute the same expected value as expected_value, scoring all
+    outcomes at once from the cached outcome table.
+    """
+    columns, weights = outcome_table(num_die_sides, num_free_dice)
+    held = list(held_dice)
+    score_boxes = [[0] * len(weights)]
+    for face in range(1, max([num_die_sides] + held) + 1):
+        extra = held.count(face)
+        if face <= num_die_sides:
+            score_boxes.append([(count + extra) * face
+                                for count in columns[face - 1]])
+        else:
+            score_boxes.append([extra * face] * len(weights))
+    scores = map(max, *score_boxes)
+    total = sum([item * weight for item, weight in zip(scores, weights)])
+    return float(total) / num_die_sides ** num_free_dice
+
+
+def expected_value(held_dice, num_die_sides, num_free_dice, batch = False):
     """
     Compute the expected value of the held_dice given that there
     are num_free_dice to be rolled, each with num_die_sides.
@@ -63,9 +183,25 @@ def expected_value(held_dice, num_die_sides, num_free_dice):
     held_dice: dice that you will hold
     num_die_sides: number of sides on each die
     num_free_dice: number of dice to be rolled
+    batch: score all outcomes at once with expected_value_batch
 
     Returns a floating point expected value
     """
+    if batch:
+        return expected_value_batch(held_dice, num_die_sides, num_free_dice)
+    die_outcomes = [index + 1 for index in range(num_die_sides)]
+    held = list(held_dice)
+    total = 0
+    for item in gen_sorted_sequences(die_outcomes, num_free_dice):
+        total += score(held + list(item)) * multinomial_weight(item)
+    return float(total) / num_die_sides ** num_free_dice
+
+
+def expected_value_sequences(held_dice, num_die_sides, num_free_dice):
+    """
+    Compute the same expected value as expected_value by scoring every
+    ordered sequence of the free dice.  Kept for comparison.
+    """
     die_outcomes = [index + 1 for index in range(num_die_sides)]
     all_sequences = gen_all_sequences(die_outcomes, num_free_dice)
     result = []
@@ -79,6 +215,18 @@ def expected_value(held_dice, num_die_sides, num_free_dice):
         exp_value += float(score(item)) / size
     return exp_value
 
+_EV_CACHE = {}
+
+def cached_expected_value(held_dice, num_die_sides, num_free_dice):
+    """
+    expected_value, remembered by (sorted held dice, sides, free dice).
+    """
+    key = (tuple(sorted(held_dice)), num_die_sides, num_free_dice)
+    if key not in _EV_CACHE:
+        _EV_CACHE[key] = expected_value(key[0], num_die_sides, num_free_dice,
+                                        batch = True)
+    return _EV_CACHE[key]
+
 
 def gen_all_holds(hand):
     """
@@ -93,6 +241,33 @@ def gen_all_holds(hand):
 
 
 
+def gen_holds_by_count(hand):
+    """
+    Generate every distinct choice of dice from hand to hold, one at a
+    time, by choosing how many of each face to keep.
+
+    hand: full yahtzee hand
+
+    Yields sorted tuples of dice to hold
+    """
+    faces = sorted(set(hand))
+    limits = [list(hand).count(face) for face in faces]
+    kept = [0] * len(faces)
+    while True:
+        hold = []
+        for idx in range(len(faces)):
+            hold.extend([faces[idx]] * kept[idx])
+        yield tuple(hold)
+        pos = 0
+        while pos < len(faces) and kept[pos] == limits[pos]:
+            kept[pos] = 0
+            pos += 1
+        if pos == len(faces):
+            return
+        kept[pos] += 1
+
+
+
 def strategy(hand, num_die_sides):
     """
     Compute the hold that maximizes the expected value when the
@@ -105,17 +280,501 @@ def strategy(hand, num_die_sides):
     the second element is a tuple of the dice to hold
     """
     all_num = len(hand)
-    hold_dices = gen_all_holds(hand)
+    hold_dices = gen_holds_by_count(hand)
     max_value = -1
     for item in hold_dices:
         free_num = all_num - len(item)
-        exp_value = expected_value(item, num_die_sides, free_num)
+        exp_value = cached_expected_value(item, num_die_sides, free_num)
         if exp_value > max_value:
             max_value = exp_value
             dices_to_hold = item
     return (max_value, dices_to_hold)
 
 
+def benchmark_holds(dice_counts = range(5, 21), num_die_sides = 6, seed = 0):
+    """
+    Compare gen_all_holds with gen_holds_by_count on a random hand of
+    each size.  Memory is the size of the set of holds (tuples
+    included) for gen_all_holds, and the largest single hold for the
+    generator, which keeps only one hold alive at a time.  Returns a
+    list of (dice, holds, powerset seconds, powerset bytes, count
+    seconds, count bytes) tuples.
+    """
+    rng = random.Random(seed)
+    results = []
+    for num_dice in dice_counts:
+        hand = tuple([rng.randint(1, num_die_sides) for dummy_i in range(num_dice)])
+        start = time.time()
+        holds = gen_all_holds(hand)
+        slow = time.time() - start
+        slow_bytes = sys.getsizeof(holds) + sum([sys.getsizeof(hold) for hold in holds])
+        num_holds = len(holds)
+        holds = None
+        start = time.time()
+        count = 0
+        fast_bytes = 0
+        for hold in gen_holds_by_count(hand):
+            count += 1
+            fast_bytes = max(fast_bytes, sys.getsizeof(hold))
+        fast = time.time() - start
+        print "%d dice: %d holds by powerset (%.4fs, %d bytes), %d by count (%.4fs, %d bytes)" % (
+            num_dice, num_holds, slow, slow_bytes, count, fast, fast_bytes)
+        results.append((num_dice, num_holds, slow, slow_bytes, fast, fast_bytes))
+    return results
+
+
+def benchmark_batch(dice_counts = range(5, 11), num_die_sides = 6):
+    """
+    Time expected_value for every distinct hold of a hand of each
+    size, one outcome at a time and in batch mode.  Returns a list of
+    (dice, seconds, batch seconds) tuples.
+    """
+    results = []
+    for num_dice in dice_counts:
+        hand = tuple([(idx % num_die_sides) + 1 for idx in range(num_dice)])
+        holds = list(gen_holds_by_count(hand))
+        _OUTCOME_TABLES.clear()
+        timings = []
+        for batch in (False, True):
+            start = time.time()
+            for hold in holds:
+                expected_value(hold, num_die_sides, num_dice - len(hold), batch)
+            timings.append(time.time() - start)
+        print "%d dice, %d holds: %.3fs one at a time, %.3fs batched (%.1fx)" % (
+            num_dice, len(holds), timings[0], timings[1],
+            timings[0] / timings[1])
+        results.append((num_dice, timings[0], timings[1]))
+    return results
+
+
+##################################################################
+# Precomputed hold tables
+
+_HOLD_TABLES = {}
+
+def hold_table_path(num_dice, num_die_sides):
+    """
+    Default file name for the hold table of the given dice and sides.
+    """
+    return "yahtzee_holds_%dd%d.bin" % (num_dice, num_die_sides)
+
+
+def build_hold_table(num_dice, num_die_sides, path = None):
+    """
+    Run strategy on every sorted hand of num_dice dice and save the
+    results to path: an array of doubles with the expected scores,
+    followed by an array of unsigned shorts with the held positions
+    of each sorted hand as a bit mask.  Hands are stored in
+    gen_sorted_sequences order.
+
+    Returns the (scores, masks) arrays.
+    """
+    assert num_dice <= 16, "Hold masks only fit 16 dice"
+    if path is None:
+        path = hold_table_path(num_dice, num_die_sides)
+    die_outcomes = [index + 1 for index in range(num_die_sides)]
+    scores = array.array("d")
+    masks = array.array("H")
+    for hand in gen_sorted_sequences(die_outcomes, num_dice):
+        value, hold = strategy(hand, num_die_sides)
+        mask = 0
+        pos = 0
+        for die in hold:
+            while hand[pos] != die:
+                pos += 1
+            mask |= 1 << pos
+            pos += 1
+        scores.append(value)
+        masks.append(mask)
+    table_file = open(path, "wb")
+    scores.tofile(table_file)
+    masks.tofile(table_file)
+    table_file.close()
+    _HOLD_TABLES.pop((num_dice, num_die_sides, path), None)
+    return scores, masks
+
+
+def load_hold_table(num_dice, num_die_sides, path = None):
+    """
+    Return the hold table for the given dice and sides, reading it
+    from path the first time it is asked for.  The file must have
+    been written by build_hold_table.  The table is a tuple (index of
+    each sorted hand, scores, masks).
+    """
+    if path is None:
+        path = hold_table_path(num_dice, num_die_sides)
+    key = (num_dice, num_die_sides, path)
+    if key in _HOLD_TABLES:
+        return _HOLD_TABLES[key]
+    assert os.path.exists(path), "No hold table at " + path + ", run build_hold_table first"
+    count = multiset_count(num_die_sides, num_dice)
+    scores = array.array("d")
+    masks = array.array("H")
+    table_file = open(path, "rb")
+    scores.fromfile(table_file, count)
+    masks.fromfile(table_file, count)
+    table_file.close()
+    die_outcomes = [index + 1 for index in range(num_die_sides)]
+    index = {}
+    for hand in gen_sorted_sequences(die_outcomes, num_dice):
+        index[hand] = len(index)
+    _HOLD_TABLES[key] = (index, scores, masks)
+    return _HOLD_TABLES[key]
+
+
+def lookup_strategy(hand, num_die_sides, path = None):
+    """
+    Same result as strategy, read from the hold table that
+    build_hold_table saved to path.  The held dice are returned in
+    sorted order.
+    """
+    hand = tuple(sorted(hand))
+    index, scores, masks = load_hold_table(len(hand), num_die_sides, path)
+    pos = index[hand]
+    mask = masks[pos]
+    hold = tuple([hand[idx] for idx in range(len(hand)) if mask >> idx & 1])
+    return (scores[pos], hold)
+
+
+def benchmark_hold_table(num_dice = 5, num_die_sides = 6, lookups = 100000):
+    """
+    Report the cold build time of a hold table, the time to load it
+    back from disk and the average lookup_strategy latency.
+    """
+    path = hold_table_path(num_dice, num_die_sides)
+    _EV_CACHE.clear()
+    start = time.time()
+    build_hold_table(num_dice, num_die_sides, path)
+    build = time.time() - start
+    start = time.time()
+    index = load_hold_table(num_dice, num_die_sides, path)[0]
+    load = time.time() - start
+    hands = list(index)
+    start = time.time()
+    for idx in range(lookups):
+        lookup_strategy(hands[idx % len(hands)], num_die_sides, path)
+    latency = (time.time() - start) / lookups
+    print "%dd%d: %d hands, build %.3fs, load %.4fs, %d bytes, lookup %.2fus" % (
+        num_dice, num_die_sides, len(hands), build, load,
+        os.path.getsize(path), latency * 1e6)
+    return build, load, latency
+
+
+def benchmark_expected_value(dice_counts = range(5, 13),
+                             side_counts = (6, 8, 10, 12, 16, 20),
+                             max_outcomes = 200000, max_sequences = 50000):
+    """
+    Time expected_value with nothing held for each number of dice and
+    sides.  Sizes with more than max_outcomes sorted outcomes are
+    skipped; the sequence version is only timed up to max_sequences
+    ordered outcomes.  Returns a list of (dice, sides, outcomes,
+    seconds, sequence seconds or None) tuples.
+    """
+    results = []
+    for num_dice in dice_counts:
+        for num_sides in side_counts:
+            outcomes = multiset_count(num_sides, num_dice)
+            if outcomes > max_outcomes:
+                print "%d dice, %d sides: %d outcomes, skipped" % (
+                    num_dice, num_sides, outcomes)
+                continue
+            start = time.time()
+            value = expected_value((), num_sides, num_dice)
+            elapsed = time.time() - start
+            slow = None
+            if num_sides ** num_dice <= max_sequences:
+                start = time.time()
+                expected_value_sequences((), num_sides, num_dice)
+                slow = time.time() - start
+            line = "%d dice, %d sides: %d outcomes, EV %.4f in %.3fs" % (
+                num_dice, num_sides, outcomes, value, elapsed)
+            if slow is not None:
+                line += " (sequences %.3fs)" % slow
+            print line
+            results.append((num_dice, num_sides, outcomes, elapsed, slow))
+    return results
+
+
+##################################################################
+# Upper section solver
+
+UPPER_BONUS_THRESHOLD = 63
+UPPER_BONUS = 35
+
+_TURN_TABLES = {}
+_SOLUTIONS = {}
+
+def turn_tables(num_dice, num_die_sides):
+    """
+    Precompute what one turn needs for the given dice and sides: the
+    sorted hands, the chance of rolling each one, the distinct holds of
+    every hand (from gen_all_holds) and, for every distinct hold, the
+    sorted hands it can lead to with their chances.
+
+    Returns a tuple (hands, hand probabilities, hold ids of each hand,
+    holds, outcomes of each hold, face counts of each hand, position
+    of each hand).
+    """
+    key = (num_dice, num_die_sides)
+    if key in _TURN_TABLES:
+        return _TURN_TABLES[key]
+    die_outcomes = [index + 1 for index in range(num_die_sides)]
+    hands = list(gen_sorted_sequences(die_outcomes, num_dice))
+    hand_index = {}
+    for hand in hands:
+        hand_index[hand] = len(hand_index)
+    total = float(num_die_sides ** num_dice)
+    hand_probs = [multinomial_weight(hand) / total for hand in hands]
+    hold_index = {}
+    holds = []
+    hold_outcomes = []
+    hand_holds = []
+    for hand in hands:
+        ids = set()
+        for hold in gen_all_holds(hand):
+            hold = tuple(sorted(hold))
+            if hold not in hold_index:
+                hold_index[hold] = len(holds)
+                holds.append(hold)
+                free = num_dice - len(hold)
+                norm = float(num_die_sides ** free)
+                outcomes = []
+                for roll in gen_sorted_sequences(die_outcomes, free):
+                    result = tuple(sorted(hold + roll))
+                    outcomes.append((hand_index[result],
+                                     multinomial_weight(roll) / norm))
+                hold_outcomes.append(outcomes)
+            ids.add(hold_index[hold])
+        hand_holds.append(sorted(ids))
+    face_counts = [[hand.count(face) for face in die_outcomes]
+                   for hand in hands]
+    _TURN_TABLES[key] = (hands, hand_probs, hand_holds, holds,
+                         hold_outcomes, face_counts, hand_index)
+    return _TURN_TABLES[key]
+
+
+def state_index(filled, subtotal):
+    """
+    Position of the state (filled categories mask, capped upper
+    subtotal) in a value table.
+    """
+    return filled * (UPPER_BONUS_THRESHOLD + 1) + subtotal
+
+
+def _hold_values(hold_outcomes, stage):
+    """
+    Expected stage value of every hold after rolling the free dice.
+    """
+    return [sum([prob * stage[idx] for idx, prob in outcomes])
+            for outcomes in hold_outcomes]
+
+
+def turn_stages(tables, num_dice, num_die_sides, filled, subtotal, values):
+    """
+    Solve one turn from the state (filled, subtotal), given the values
+    of the states after it.  Returns a tuple (value before the first
+    roll, best value of each hand after the first roll, after the
+    second roll, after the third roll, hold values before the second
+    roll, hold values before the third roll).
+    """
+    hand_probs, hand_holds, hold_outcomes, face_counts = (
+        tables[1], tables[2], tables[4], tables[5])
+    options = []
+    for face_idx in range(num_die_sides):
+        if filled >> face_idx & 1:
+            continue
+        face = face_idx + 1
+        row = []
+        for count in range(num_dice + 1):
+            gain = face * count
+            new_subtotal = min(UPPER_BONUS_THRESHOLD, subtotal + gain)
+            bonus = 0
+            if subtotal < UPPER_BONUS_THRESHOLD <= subtotal + gain:
+                bonus = UPPER_BONUS
+            row.append(gain + bonus +
+                       values[state_index(filled | 1 << face_idx, new_subtotal)])
+        options.append((face_idx, row))
+    third = [max([row[counts[face_idx]] for face_idx, row in options])
+             for counts in face_counts]
+    third_holds = _hold_values(hold_outcomes, third)
+    second = [max([third_holds[idx] for idx in ids]) for ids in hand_holds]
+    second_holds = _hold_values(hold_outcomes, second)
+    first = [max([second_holds[idx] for idx in ids]) for ids in hand_holds]
+    value = sum([prob * best for prob, best in zip(hand_probs, first)])
+    return (value, first, second, third, second_holds, third_holds)
+
+
+_REACHABLE = {}
+
+def reachable_subtotals(num_dice, num_die_sides):
+    """
+    Capped upper subtotals that can occur with each filled mask.
+    Returns a list indexed by mask of sorted lists.
+    """
+    if (num_dice, num_die_sides) in _REACHABLE:
+        return _REACHABLE[(num_dice, num_die_sides)]
+    reach = [set() for dummy_mask in range(1 << num_die_sides)]
+    reach[0].add(0)
+    for filled in range(1 << num_die_sides):
+        for face_idx in range(num_die_sides):
+            if filled >> face_idx & 1:
+                continue
+            gains = [(face_idx + 1) * count for count in range(num_dice + 1)]
+            target = reach[filled | 1 << face_idx]
+            for subtotal in reach[filled]:
+                for gain in gains:
+                    target.add(min(UPPER_BONUS_THRESHOLD, subtotal + gain))
+    _REACHABLE[(num_dice, num_die_sides)] = [sorted(subtotals) for subtotals in reach]
+    return _REACHABLE[(num_dice, num_die_sides)]
+
+
+def _solve_task(task):
+    """
+    Pool worker: solve a list of states of one layer.
+    """
+    num_dice, num_die_sides, states, values = task
+    tables = turn_tables(num_dice, num_die_sides)
+    return [(state_index(filled, subtotal),
+             turn_stages(tables, num_dice, num_die_sides,
+                         filled, subtotal, values)[0])
+            for filled, subtotal in states]
+
+
+def solution_path(num_dice, num_die_sides):
+    """
+    Default file name for the solved value table.
+    """
+    return "yahtzee_upper_%dd%d.bin" % (num_dice, num_die_sides)
+
+
+def solve_upper(num_dice = 5, num_die_sides = 6, path = None,
+                processes = None, chunk_size = 32):
+    """
+    Solve the upper section game (one category per face, 35 bonus
+    points for 63 or more) with three rolls per turn, working backward
+    one layer of filled categories at a time.  Each layer is spread
+    over a process pool, started on first use, unless processes is 1.
+    Only reachable states are solved.
+
+    The values are saved to path as an array of doubles indexed by
+    state_index.  Prints the solve time, table size and expected score,
+    and returns the array.
+    """
+    if path is None:
+        path = solution_path(num_dice, num_die_sides)
+    start = time.time()
+    tables = turn_tables(num_dice, num_die_sides)
+    reach = reachable_subtotals(num_dice, num_die_sides)
+    values = array.array("d", [0.0]) * ((1 << num_die_sides) *
+                                        (UPPER_BONUS_THRESHOLD + 1))
+    pool = None
+    solved = 0
+    try:
+        for layer in range(num_die_sides - 1, -1, -1):
+            states = [(filled, subtotal)
+                      for filled in range(1 << num_die_sides)
+                      if bin(filled).count("1") == layer
+                      for subtotal in reach[filled]]
+            tasks = [(num_dice, num_die_sides, states[idx:idx + chunk_size], values)
+                     for idx in range(0, len(states), chunk_size)]
+            if processes == 1:
+                results = map(_solve_task, tasks)
+            else:
+                if pool is None:
+                    import multiprocessing
+                    pool = multiprocessing.Pool(processes)
+                results = pool.map(_solve_task, tasks)
+            for chunk in results:
+                for idx, value in chunk:
+                    values[idx] = value
+            solved += len(states)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - start
+    table_file = open(path, "wb")
+    values.tofile(table_file)
+    table_file.close()
+    print "%dd%d upper section: %d states solved in %.2fs, table %d entries (%d bytes)" % (
+        num_dice, num_die_sides, solved, elapsed, len(values),
+        len(values) * values.itemsize)
+    print "Expected score with optimal play: %.4f" % values[state_index(0, 0)]
+    _SOLUTIONS.pop((num_dice, num_die_sides, path), None)
+    return values
+
+
+def load_upper(num_dice = 5, num_die_sides = 6, path = None):
+    """
+    Return the solved value table, reading it from path the first time
+    it is asked for.  The file must have been written by solve_upper.
+    """
+    if path is None:
+        path = solution_path(num_dice, num_die_sides)
+    key = (num_dice, num_die_sides, path)
+    if key in _SOLUTIONS:
+        return _SOLUTIONS[key]
+    assert os.path.exists(path), "No solved table at " + path + ", run solve_upper first"
+    values = array.array("d")
+    table_file = open(path, "rb")
+    values.fromfile(table_file, (1 << num_die_sides) * (UPPER_BONUS_THRESHOLD + 1))
+    table_file.close()
+    _SOLUTIONS[key] = values
+    return values
+
+
+def advise(hand, rolls_left, filled, subtotal, num_die_sides = 6, path = None):
+    """
+    Best play for the current turn under the solved table.
+
+    hand: dice showing now
+    rolls_left: rerolls still allowed this turn (2, 1 or 0)
+    filled: set of faces whose categories are already used
+    subtotal: upper section points scored so far
+
+    Returns a tuple (expected final score from here, dice to hold) when
+    rolls_left is 1 or 2, or (expected final score, face to score) when
+    rolls_left is 0.  The expected score counts points still to come.
+    """
+    num_dice = len(hand)
+    mask = 0
+    for face in filled:
+        mask |= 1 << (face - 1)
+    assert mask != (1 << num_die_sides) - 1, "Every category is filled"
+    subtotal = min(UPPER_BONUS_THRESHOLD, subtotal)
+    assert subtotal in reachable_subtotals(num_dice, num_die_sides)[mask], (
+        "Subtotal " + str(subtotal) + " cannot be scored with the filled categories")
+    values = load_upper(num_dice, num_die_sides, path)
+    tables = turn_tables(num_dice, num_die_sides)
+    hand_holds, holds, hand_index = tables[2], tables[3], tables[6]
+    hand = tuple(sorted(hand))
+    assert hand in hand_index, "Not a hand of " + str(num_die_sides) + "-sided dice"
+    if rolls_left == 0:
+        best = None
+        for face in range(1, num_die_sides + 1):
+            if face in filled:
+                continue
+            gain = face * hand.count(face)
+            bonus = 0
+            if subtotal < UPPER_BONUS_THRESHOLD <= subtotal + gain:
+                bonus = UPPER_BONUS
+            value = gain + bonus + values[state_index(
+                mask | 1 << (face - 1),
+                min(UPPER_BONUS_THRESHOLD, subtotal + gain))]
+            if best is None or value > best[0]:
+                best = (value, face)
+        return best
+    assert rolls_left in (1, 2), "At most two rerolls per turn"
+    stages = turn_stages(tables, num_dice, num_die_sides, mask, subtotal, values)
+    if rolls_left == 2:
+        hold_values = stages[4]
+    else:
+        hold_values = stages[5]
+    best = max([(hold_values[idx], idx)
+                for idx in hand_holds[hand_index[hand]]])
+    return (best[0], holds[best[1]])
+
+
 def run_example():
     """
     Compute the dice to hold and expected score for an example hand